@@ -0,0 +1,40 @@
+# Async serving mode: uvicorn asgi:app
+# Same routes and payloads as main.py, but each stream is a coroutine on one
+# event loop instead of a pinned worker thread.
+import os
+import sys
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.asgi import create_app, create_async_client, streaming_response
+from main import SYSTEM_MESSAGE
+
+load_dotenv()
+
+client = create_async_client()
+
+async def chat(request):
+    data = await request.json()
+    messages = data.get('messages', [])
+
+    # Filter out existing system messages and prepend ours
+    filtered_messages = [msg for msg in messages if msg.get("role") != "system"]
+    messages_with_system = [SYSTEM_MESSAGE] + filtered_messages
+
+    try:
+        response = await client.chat.completions.create(
+            model="deepseek-chat",
+            messages=messages_with_system,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        # SSE or NDJSON depending on the Accept header
+        return streaming_response(response, request.headers.get('accept'))
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+app = create_app([Route('/chat', chat, methods=['POST'])])
@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify, Response  # Update Response import
+from flask import Flask, request, jsonify
 from flask_cors import CORS
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
-import json
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.streaming import streaming_response
 
 load_dotenv()  # Load environment variables
 
@@ -33,15 +36,12 @@ def chat():
         response = client.chat.completions.create(
             model="deepseek-chat",
             messages=messages_with_system,
-            stream=True  # Enable streaming
+            stream=True,  # Enable streaming
+            stream_options={"include_usage": True}
         )
 
-        def generate():
-            for chunk in response:
-                if content := chunk.choices[0].delta.content:
-                    yield json.dumps({"content": content})
-
-        return Response(generate(), mimetype="application/json")
+        # SSE or NDJSON depending on the Accept header
+        return streaming_response(response, request.headers.get('Accept'))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
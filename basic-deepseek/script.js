@@ -30,28 +30,45 @@ async function sendMessage() {
     try {
         const response = await fetch('http://localhost:5000/chat', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/x-ndjson'
+            },
             body: JSON.stringify({ messages: conversationHistory })
         });
 
         if (!response.ok) throw new Error('Network error');
 
-        // Stream processing logic (new code)
+        // Stream processing: one JSON event per line, which may be split across reads
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
+        let buffer = '';
         
         while (true) {
             const { done, value } = await reader.read();
             if (done) break;
             
-            const decodedChunk = decoder.decode(value);
-            try {
-                const data = JSON.parse(decodedChunk);
-                botContent += data.content;
-                messageDiv.textContent = botContent; // Update UI incrementally
-                messagesDiv.scrollTop = messagesDiv.scrollHeight; // Auto-scroll
-            } catch (e) {
-                console.error('Error parsing chunk:', e);
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop(); // Keep any partial line for the next read
+
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                let data;
+                try {
+                    data = JSON.parse(line);
+                } catch (e) {
+                    console.error('Error parsing chunk:', e);
+                    continue;
+                }
+
+                if (data.type === 'content') {
+                    botContent += data.content;
+                    messageDiv.textContent = botContent; // Update UI incrementally
+                    messagesDiv.scrollTop = messagesDiv.scrollHeight; // Auto-scroll
+                } else if (data.type === 'error') {
+                    throw new Error(data.error);
+                }
             }
         }
 
@@ -0,0 +1,137 @@
+import os
+import pickle
+import re
+import sqlite3
+import sys
+from typing import NamedTuple, Optional
+
+INTENTS = ("save_note", "list_notes", "delete_notes", "other")
+
+class IntentDecision(NamedTuple):
+    intent: str
+    confidence: float
+    source: str                  # "rules" or "model"
+    query: Optional[str] = None  # Delete query, when the rule could extract it
+
+# (intent, confidence, pattern). Patterns are anchored and conservative: anything
+# they don't clearly match falls through to the model or the LLM. Saving needs an
+# explicit note marker; bare "remember ..."/"save ..."/"note ..." is often a
+# question or request ("remember when we...", "save me some time") and is escalated.
+RULES = [
+    # "remember this: ...", "note that: ...", "remember: ...", "note: ..."
+    ("save_note", 0.95, re.compile(
+        r"^(please\s+)?(remember|save|note|jot down|write down)(\s+(this|that))?\s*:\s*\S", re.I)),
+    # "save a note ...", "make a note of ...", "take a note: ..."
+    ("save_note", 0.95, re.compile(
+        r"^(please\s+)?(save|make|take|add|create|write)\s+(a|this as a|that as a)\s+note\b[:,]?\s*\S", re.I)),
+    # "add to my notes: ...", "add buy milk to my notes"
+    ("save_note", 0.95, re.compile(
+        r"^(please\s+)?add\s+((this|that)\s+)?to\s+my\s+notes\b[:,]?\s*\S", re.I)),
+    ("save_note", 0.95, re.compile(
+        r"^(please\s+)?add\s+.+\s+to\s+my\s+notes\s*[.!]?$", re.I)),
+    ("list_notes", 0.95, re.compile(
+        r"^(please\s+)?(show|list|display|give)(\s+me)?(\s+(all|my|all my|the))?\s+notes\b", re.I)),
+    ("list_notes", 0.9, re.compile(
+        r"^(what (notes do i have|do you remember|have we discussed))\b", re.I)),
+    # The query stops before filler like "in them" and trailing punctuation
+    ("delete_notes", 0.95, re.compile(
+        r"^(please\s+)?(delete|remove|get rid of|clear|forget)(\s+(all|my|all my|the|any))?(\s+notes?)\s+"
+        r"(about|on|containing|related to|regarding|mentioning|with)\s+(?P<query>.+?)"
+        r"(\s+in\s+(them|it|the text))?\s*[.!]?$", re.I)),
+]
+
+# Inputs without any of these words are plain conversation
+NOTE_KEYWORDS = re.compile(
+    r"\b(notes?|remember|save|jot|delete|remove|forget|list|discussed|get rid of)\b", re.I)
+
+class IntentClassifier:
+    """Local intent classification in front of the LLM.
+
+    Keyword/regex rules answer clear-cut inputs; an optional TF-IDF + logistic
+    regression model trained on logged LLM decisions handles the rest when it
+    is confident enough. classify() returns None when the input should be
+    escalated to the LLM.
+    """
+
+    def __init__(self, model_path: str = "intent_model.pkl", threshold: float = 0.8):
+        self.model_path = model_path
+        self.threshold = threshold
+        self.model = self._load_model(model_path)
+        self.stats = {"rules": 0, "model": 0, "escalated": 0}
+
+    @staticmethod
+    def _load_model(model_path: str):
+        if not os.path.exists(model_path):
+            return None
+        try:
+            with open(model_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Error loading intent model: {e}")
+            return None
+
+    def classify(self, user_input: str) -> Optional[IntentDecision]:
+        """Return a confident local decision, or None to escalate to the LLM"""
+        text = user_input.strip()
+
+        decision = self._match_rules(text)
+        if decision is None and self.model is not None:
+            probabilities = self.model.predict_proba([text])[0]
+            best = probabilities.argmax()
+            decision = IntentDecision(self.model.classes_[best], float(probabilities[best]), "model")
+
+        if decision is None or decision.confidence < self.threshold:
+            self.stats["escalated"] += 1
+            return None
+        self.stats[decision.source] += 1
+        return decision
+
+    @staticmethod
+    def _match_rules(text: str) -> Optional[IntentDecision]:
+        for intent, confidence, pattern in RULES:
+            if match := pattern.search(text):
+                query = match.groupdict().get("query")
+                return IntentDecision(intent, confidence, "rules", query and query.strip())
+
+        if not NOTE_KEYWORDS.search(text):
+            return IntentDecision("other", 0.9, "rules")
+        return None
+
+    def format_stats(self) -> str:
+        total = sum(self.stats.values())
+        if not total:
+            return "No inputs classified yet"
+        local = self.stats["rules"] + self.stats["model"]
+        return (f"Local hits: {local}/{total} ({local / total:.0%}) - "
+                f"rules: {self.stats['rules']}, model: {self.stats['model']}, "
+                f"escalated to LLM: {self.stats['escalated']}")
+
+def train(db_path: str = "notes.db", model_path: str = "intent_model.pkl") -> int:
+    """Train the local model from LLM decisions logged in intent_log; returns the sample count"""
+    # scikit-learn is only needed for training and the optional model
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT input, intent FROM intent_log").fetchall()
+    finally:
+        conn.close()
+
+    if len({intent for _, intent in rows}) < 2:
+        raise ValueError("Need logged decisions for at least two intents to train")
+
+    model = make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+        LogisticRegression(max_iter=1000)
+    )
+    model.fit([text for text, _ in rows], [intent for _, intent in rows])
+
+    with open(model_path, "wb") as f:
+        pickle.dump(model, f)
+    return len(rows)
+
+if __name__ == "__main__":
+    count = train(*sys.argv[1:3])
+    print(f"Trained intent model on {count} logged decisions")
@@ -1,11 +1,38 @@
+import json
+import os
+import re
 import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import llm_handler
+from intent_classifier import IntentClassifier, INTENTS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.note_index import NoteVectorIndex, to_blob, from_blob
+
+# Maximum number of full-text matches sent to the LLM to confirm a delete
+DELETE_CANDIDATES = 20
+
+# Notes at least this similar to a delete query are selected without asking the LLM
+# (same default as telegram-agent; unrelated texts already score around 0.7 with ada-style models)
+SEMANTIC_THRESHOLD = float(os.getenv("NOTE_SIMILARITY_THRESHOLD", "0.8"))
+
+# Notes per embeddings request when backfilling
+EMBED_BATCH = 64
 
 class Interpreter:
-    def __init__(self, db_path: str = "notes.db"):
+    def __init__(self, db_path: str = "notes.db", llm: Optional[llm_handler.LLMHandler] = None,
+                 classifier: Optional[IntentClassifier] = None):
         self.conn = sqlite3.connect(db_path)
+        # One handler (and connection pool) shared by every LLM call
+        self.llm = llm or llm_handler.LLMHandler()
+        # Local classifier that answers clear-cut intents without an LLM round-trip
+        self.classifier = classifier or IntentClassifier()
         self._init_db()
+        # Note embeddings held in memory for local semantic search
+        self.note_index = NoteVectorIndex()
+        self._load_note_index()
 
     def _init_db(self):
         """Initialize database with notes and categories tables if they don't exist"""
@@ -35,8 +62,101 @@ class Interpreter:
                 FOREIGN KEY (category_id) REFERENCES categories(id)
             )
         """)
+
+        # Full-text index over notes, kept in sync by triggers
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'")
+        fts_exists = cursor.fetchone() is not None
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                content, formatted_content,
+                content='notes', content_rowid='id',
+                tokenize='porter unicode61'
+            )
+        """)
+        cursor.executescript("""
+            CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, content, formatted_content)
+                VALUES (new.id, new.content, new.formatted_content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, content, formatted_content)
+                VALUES ('delete', old.id, old.content, old.formatted_content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, content, formatted_content)
+                VALUES ('delete', old.id, old.content, old.formatted_content);
+                INSERT INTO notes_fts (rowid, content, formatted_content)
+                VALUES (new.id, new.content, new.formatted_content);
+            END;
+        """)
+        if not fts_exists:
+            # Index notes saved before the full-text table existed
+            cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+        # One float32 embedding per note, for local semantic search
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS note_embeddings (
+                note_id INTEGER PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                FOREIGN KEY (note_id) REFERENCES notes(id)
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS note_embeddings_delete AFTER DELETE ON notes BEGIN
+                DELETE FROM note_embeddings WHERE note_id = old.id;
+            END
+        """)
+
+        # LLM intent decisions, used as training data for the local classifier
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS intent_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                input TEXT NOT NULL,
+                intent TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
         self.conn.commit()
 
+    def _load_note_index(self):
+        """Load stored note embeddings, embedding any notes saved without one"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT note_id, embedding FROM note_embeddings")
+        for note_id, blob in cursor.fetchall():
+            self.note_index.add(None, note_id, from_blob(blob))
+
+        cursor.execute("""
+            SELECT n.id, n.content FROM notes n
+            LEFT JOIN note_embeddings e ON e.note_id = n.id
+            WHERE e.note_id IS NULL
+        """)
+        missing = cursor.fetchall()
+        for i in range(0, len(missing), EMBED_BATCH):
+            batch = missing[i:i + EMBED_BATCH]
+            try:
+                embeddings = self.llm.embed([content for _, content in batch])
+            except Exception as e:
+                print(f"Error embedding existing notes: {e}")
+                return
+            for (note_id, _), embedding in zip(batch, embeddings):
+                self._store_embedding(note_id, embedding)
+            # Keep finished batches if a later one fails
+            self.conn.commit()
+
+    def _embed_note(self, note_content: str) -> Optional[list[float]]:
+        try:
+            return self.llm.embed([note_content])[0]
+        except Exception as e:
+            print(f"Error embedding note: {e}")
+            return None
+
+    def _store_embedding(self, note_id: int, embedding: list[float]):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO note_embeddings (note_id, embedding) VALUES (?, ?)",
+            (note_id, to_blob(embedding))
+        )
+        self.note_index.add(None, note_id, embedding)
+
     def handle_input(self, user_input: str) -> str:
         """Process user input and return appropriate response"""
         # Handle confirmation responses first
@@ -57,29 +177,39 @@ class Interpreter:
             elif user_input.startswith('/list'):
                 return self._list_notes()
             elif user_input.startswith('/help'):
-                return "Available commands:\n/save [note] - Save a note\n/list - List all notes\n/categories - List all categories\n/delete [query] - Delete notes matching query"
+                return "Available commands:\n/save [note] - Save a note\n/list - List all notes\n/categories - List all categories\n/delete [query] - Delete notes matching query\n/search [query] - Search notes\n/intents - Show local intent classifier stats"
             elif user_input.startswith('/categories'):
                 return self._list_categories()
             elif user_input.startswith('/delete'):
                 return self._delete_notes(user_input)
+            elif user_input.startswith('/search'):
+                return self._search_command(user_input)
+            elif user_input.startswith('/intents'):
+                return self.classifier.format_stats()
             else:
                 return "Unknown command. Type /help for available commands"
             
-        # Check for natural language note commands
-        intent = self._classify_intent(user_input)
+        # Check for natural language note commands, locally first and via the LLM if unsure
+        decision = self.classifier.classify(user_input)
+        if decision:
+            intent = decision.intent
+        else:
+            intent = self._classify_intent(user_input)
+            self._log_intent(user_input, intent)
+
         if intent == "save_note":
             return self._save_note(f"/save {user_input}")
         elif intent == "list_notes":
             return self._list_notes()
         elif intent == "delete_notes":
-            return self._delete_notes(f"/delete {self._extract_delete_query(user_input)}")
+            query = decision.query if decision and decision.query else self._extract_delete_query(user_input)
+            return self._delete_notes(f"/delete {query}")
             
         # Only use LLM for non-note related inputs
         return self._generate_response(user_input)
 
     def _extract_delete_query(self, user_input: str) -> str:
         """Extract the query portion from natural language delete requests"""
-        handler = llm_handler.LLMHandler()
         prompt = f"""Extract the query portion from this delete request:
         Input: {user_input}
         
@@ -89,11 +219,10 @@ class Interpreter:
         - "remove notes containing meeting notes" → "meeting notes"
         
         Return only the extracted query:"""
-        return handler.generate_response(prompt).strip()
+        return self.llm.generate_response(prompt).strip()
 
     def _classify_intent(self, user_input: str) -> str:
         """Classify user intent using LLM"""
-        handler = llm_handler.LLMHandler()
         prompt = f"""Classify the user's intent from their input:
         Input: {user_input}
         
@@ -105,12 +234,17 @@ class Interpreter:
         
         Return only the intent name (save_note, list_notes, delete_notes, or other)"""
         
-        response = handler.generate_response(prompt)
+        response = self.llm.generate_response(prompt)
         return response.strip().lower()
 
+    def _log_intent(self, user_input: str, intent: str):
+        """Record an LLM intent decision as training data for the local classifier"""
+        if intent in INTENTS:
+            self.conn.execute("INSERT INTO intent_log (input, intent) VALUES (?, ?)", (user_input, intent))
+            self.conn.commit()
+
     def _get_category_for_note(self, note_content: str) -> str:
         """Determine the most relevant category for a note using LLM"""
-        handler = llm_handler.LLMHandler()
         prompt = f"""Analyze this note and determine the single most relevant category:
         {note_content}
         
@@ -124,11 +258,10 @@ class Interpreter:
         - Documentation
         
         Return only the category name:"""
-        return handler.generate_response(prompt).strip()
+        return self.llm.generate_response(prompt).strip()
 
     def _format_note(self, note_content: str) -> str:
         """Format note content to improve grammar, spelling and cohesion"""
-        handler = llm_handler.LLMHandler()
         prompt = f"""Please format this note to improve its grammar, spelling and cohesion:
         {note_content}
         
@@ -138,7 +271,50 @@ class Interpreter:
         - Maintain the original meaning
         - Keep the same overall structure
         - Return only the formatted note"""
-        return handler.generate_response(prompt).strip()
+        return self.llm.generate_response(prompt).strip()
+
+    def _process_note(self, note_content: str) -> tuple[str, str]:
+        """Categorize and format a note in one structured LLM call.
+
+        Falls back to the separate category and format prompts, run
+        concurrently, if the response doesn't match the expected schema.
+        """
+        prompt = f"""Analyze this note, determine the single most relevant category and format it:
+        {note_content}
+        
+        Choose from these general categories or suggest a new specific one:
+        - Work
+        - Personal
+        - Ideas
+        - Reminders
+        - Research
+        - Code
+        - Documentation
+        
+        Formatting rules:
+        - Fix any spelling and grammar errors
+        - Make sentences more clear and concise
+        - Maintain the original meaning
+        - Keep the same overall structure
+        
+        Return only a JSON object of the form:
+        {{"category": "<category name>", "formatted_note": "<formatted note>"}}"""
+
+        response = self.llm.generate_response(prompt, json_output=True)
+        try:
+            result = json.loads(response)
+            category = result["category"].strip()
+            formatted_note = result["formatted_note"].strip()
+            if category and formatted_note and "\n" not in category and len(category) <= 50:
+                return category, formatted_note
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+            pass
+
+        # The two prompts are independent, so don't pay for them back to back
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            category = executor.submit(self._get_category_for_note, note_content)
+            formatted_note = executor.submit(self._format_note, note_content)
+            return category.result(), formatted_note.result()
 
     def _save_note(self, input_text: str) -> str:
         """Save note to database with automatic categorization"""
@@ -149,13 +325,13 @@ class Interpreter:
         # Store note as plain text without formatting
         processed_note = note_content.strip()
         
-        # Get category and save note
-        category = self._get_category_for_note(processed_note)
+        # Get category and formatted note, embedding the note at the same time
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            embedding = executor.submit(self._embed_note, processed_note)
+            category, formatted_note = self._process_note(processed_note)
+            embedding = embedding.result()
         cursor = self.conn.cursor()
         
-        # Format note
-        formatted_note = self._format_note(processed_note)
-        
         # Save note with both raw and formatted content
         cursor.execute("""
             INSERT INTO notes (content, formatted_content) 
@@ -171,6 +347,9 @@ class Interpreter:
         # Link note to category
         cursor.execute("INSERT INTO note_category (note_id, category_id) VALUES (?, ?)", 
                       (note_id, category_id))
+
+        if embedding is not None:
+            self._store_embedding(note_id, embedding)
         
         self.conn.commit()
         return f"Note saved in category '{category}': {processed_note}"
@@ -208,8 +387,37 @@ class Interpreter:
 
     def _generate_response(self, input_text: str) -> str:
         """Generate response using LLM"""
-        handler = llm_handler.LLMHandler()
-        return handler.generate_response(input_text)
+        return self.llm.generate_response(input_text)
+
+    def _search_notes(self, query: str, limit: int = DELETE_CANDIDATES) -> list[tuple[int, str]]:
+        """Return (id, content) of the best full-text matches for query, best first"""
+        # Quote each word so user input can't be parsed as FTS5 query syntax,
+        # and match any of them by prefix
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"*' for term in terms)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT n.id, n.content
+            FROM notes_fts
+            JOIN notes n ON n.id = notes_fts.rowid
+            WHERE notes_fts MATCH ?
+            ORDER BY notes_fts.rank
+            LIMIT ?
+        """, (match, limit))
+        return cursor.fetchall()
+
+    def _search_command(self, input_text: str) -> str:
+        """Full-text search over saved notes"""
+        query = input_text[len("/search"):].strip()
+        if not query:
+            return "Error: No query provided after /search"
+
+        matches = self._search_notes(query)
+        if not matches:
+            return "No matching notes found"
+        return "\n".join(f"- {content}" for _, content in matches)
 
     def _delete_notes(self, input_text: str) -> str:
         """Delete notes matching the given query after confirmation"""
@@ -217,38 +425,63 @@ class Interpreter:
         if not query:
             return "Error: No query provided after /delete"
 
-        # Find matching notes
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, content FROM notes")
-        all_notes = cursor.fetchall()
+        # Semantic matches are selected locally, with no LLM call
+        matching_notes = self._semantic_search(query)
+        if matching_notes:
+            return self._confirm_delete_prompt(matching_notes)
+
+        # Otherwise narrow down to the best full-text matches so the prompt doesn't grow with every note
+        candidates = self._search_notes(query)
+        if not candidates:
+            return "No matching notes found"
         
-        # Use LLM to find relevant notes
-        handler = llm_handler.LLMHandler()
+        # Use LLM to confirm which candidates are relevant
+        notes_list = "\n".join(f"{note_id}: {content}" for note_id, content in candidates)
         prompt = f"""Given these notes and a query, return only the IDs of notes that should be deleted:
         Query: {query}
-        Notes:
-        {all_notes}
+        Notes (ID: content):
+        {notes_list}
         
         Return only a comma-separated list of IDs to delete, or 'none' if no matches found"""
         
-        response = handler.generate_response(prompt).strip()
+        response = self.llm.generate_response(prompt).strip()
         if response.lower() == 'none':
             return "No matching notes found"
             
         try:
-            self._pending_delete_ids = [int(id_str) for id_str in response.split(',')]
+            selected_ids = {int(id_str) for id_str in response.split(',')}
         except ValueError:
             return "Error: Invalid response from LLM"
             
-        # Get note contents for confirmation
-        cursor.execute("SELECT id, content FROM notes WHERE id IN ({})".format(
-            ','.join('?' for _ in self._pending_delete_ids)), self._pending_delete_ids)
-        matching_notes = cursor.fetchall()
-        
+        # Only candidates can be deleted, whatever IDs the LLM came up with
+        matching_notes = [(note_id, content) for note_id, content in candidates if note_id in selected_ids]
         if not matching_notes:
             return "No matching notes found"
-            
-        # Show confirmation prompt
+        return self._confirm_delete_prompt(matching_notes)
+
+    def _semantic_search(self, query: str, limit: int = DELETE_CANDIDATES) -> list[tuple[int, str]]:
+        """Return (id, content) of notes similar to query, most similar first"""
+        if not len(self.note_index):
+            return []
+        try:
+            query_embedding = self.llm.embed([query])[0]
+        except Exception as e:
+            print(f"Error embedding query, falling back to full-text search: {e}")
+            return []
+
+        matches = self.note_index.search(None, query_embedding, k=limit, threshold=SEMANTIC_THRESHOLD)
+        if not matches:
+            return []
+        note_ids = [note_id for note_id, _ in matches]
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, content FROM notes WHERE id IN ({})".format(
+            ','.join('?' for _ in note_ids)), note_ids)
+        contents = dict(cursor.fetchall())
+        return [(note_id, contents[note_id]) for note_id in note_ids if note_id in contents]
+
+    def _confirm_delete_prompt(self, matching_notes: list[tuple[int, str]]) -> str:
+        """Remember the notes pending deletion and ask the user to confirm"""
+        self._pending_delete_ids = [note_id for note_id, _ in matching_notes]
         notes_list = "\n".join(f"- {content}" for _, content in matching_notes)
         return f"Do you want to delete these notes?\n{notes_list}\n\nType 'yes' to confirm or 'no' to cancel"
 
@@ -260,6 +493,7 @@ class Interpreter:
         cursor.execute("DELETE FROM note_category WHERE note_id IN ({})".format(
             ','.join('?' for _ in note_ids)), note_ids)
         self.conn.commit()
+        self.note_index.remove(note_ids)
         return f"Deleted {len(note_ids)} notes"
 
     def _list_categories(self) -> str:
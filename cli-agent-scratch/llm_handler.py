@@ -1,12 +1,37 @@
 import os
+import httpx
 from openai import OpenAI
-from typing import Generator
+from typing import Generator, Optional
+
+def create_client(timeout: float = 30.0, max_retries: int = 3, max_connections: int = 10) -> OpenAI:
+    """Create a long-lived client with a keep-alive connection pool.
+
+    Reusing one client means connections (and their TLS sessions) are shared
+    across calls instead of being set up again for every request. The OpenAI
+    client retries connection errors, 429s and 5xx with exponential backoff.
+    """
+    return OpenAI(
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url="https://api.deepseek.com",
+        timeout=timeout,
+        max_retries=max_retries,
+        http_client=httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=300
+            ),
+            timeout=timeout
+        )
+    )
+
+EMBEDDING_MODEL = "text-embedding-002"  # Same model as the rag server; verify with Deepseek docs
 
 class LLMHandler:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
+    def __init__(self, client: Optional[OpenAI] = None):
+        self.client = client or create_client(
+            timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3"))
         )
         self.command_prefixes = ['/help', '/save', '/list']
         self.system_message = {
@@ -20,12 +45,13 @@ class LLMHandler:
             When the user wants to save a note, extract just the note content without any additional commentary."""
         }
 
-    def generate_response(self, prompt: str, stream: bool = False) -> str | Generator:
+    def generate_response(self, prompt: str, stream: bool = False, json_output: bool = False) -> str | Generator:
         """Generate response using LLM
         
         Args:
             prompt: User input prompt
             stream: Whether to stream the response
+            json_output: Ask the model for a single JSON object (the prompt must mention JSON)
             
         Returns:
             str or Generator: Complete response or streaming generator
@@ -39,7 +65,8 @@ class LLMHandler:
             response = self.client.chat.completions.create(
                 model="deepseek-chat",
                 messages=messages,
-                stream=stream
+                stream=stream,
+                **({"response_format": {"type": "json_object"}} if json_output else {})
             )
             
             if stream:
@@ -53,3 +80,8 @@ class LLMHandler:
             
         except Exception as e:
             return f"Error generating response: {str(e)}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts in one request, in input order. Unlike generate_response, errors are raised."""
+        response = self.client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
@@ -1,9 +1,11 @@
 from interpreter import Interpreter
+from llm_handler import LLMHandler
 
 def main():
     print("Welcome to the Chatbot/Note-Taking Interface!")
     print("Type /help for available commands")
-    interpreter = Interpreter()
+    # Single long-lived LLM client shared by every command for the whole session
+    interpreter = Interpreter(llm=LLMHandler())
 
     while True:
         try:
@@ -0,0 +1,55 @@
+import pytest
+
+from intent_classifier import IntentClassifier
+
+match_rules = IntentClassifier._match_rules
+
+@pytest.mark.parametrize("text", [
+    "remember this: buy milk",
+    "Remember that: the dentist is on Friday",
+    "note: call mom",
+    "please save this: wifi password is on the fridge",
+    "save a note to renew the passport",
+    "make a note of the meeting time",
+    "take a note: pick up the dry cleaning",
+    "add to my notes: book flights",
+    "add buy eggs to my notes",
+])
+def test_explicit_save_markers_use_rules(text):
+    decision = match_rules(text)
+    assert decision is not None and decision.intent == "save_note"
+
+@pytest.mark.parametrize("text", [
+    "Remember when we went to Paris last summer?",
+    "remember the capital of France?",
+    "save me some time and explain recursion",
+    "Note the difference between TCP and UDP for me",
+    "remember to buy milk",
+    "make a note",
+])
+def test_bare_save_verbs_are_escalated(text):
+    # Note keywords without an explicit marker go to the model or the LLM
+    assert match_rules(text) is None
+
+@pytest.mark.parametrize("text, query", [
+    ("delete notes about cats", "cats"),
+    ("clear all notes with cats in them", "cats"),
+    ("remove my notes containing meeting notes.", "meeting notes"),
+    ("forget notes related to the old job", "the old job"),
+])
+def test_delete_rule_extracts_query(text, query):
+    decision = match_rules(text)
+    assert decision.intent == "delete_notes"
+    assert decision.query == query
+
+@pytest.mark.parametrize("text", ["show me my notes", "list notes", "what notes do I have"])
+def test_list_rules(text):
+    assert match_rules(text).intent == "list_notes"
+
+def test_plain_chat_is_other():
+    assert match_rules("what's the weather like in Berlin?").intent == "other"
+
+def test_classify_escalates_without_model(tmp_path):
+    classifier = IntentClassifier(model_path=str(tmp_path / "missing.pkl"))
+    assert classifier.classify("Remember when we went to Paris last summer?") is None
+    assert classifier.stats["escalated"] == 1
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+
+from openai import AsyncOpenAI
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse
+
+from llm_common.streaming import (
+    HEARTBEAT_INTERVAL,
+    STREAM_HEADERS,
+    StreamStats,
+    encode_event,
+    encode_heartbeat,
+    negotiate_format,
+)
+
+logger = logging.getLogger(__name__)
+
+def create_async_client():
+    """Deepseek client for the async servers; one per process, shared by all requests"""
+    return AsyncOpenAI(
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url="https://api.deepseek.com"
+    )
+
+def create_app(routes):
+    """Starlette app with the same open CORS policy as the Flask servers"""
+    return Starlette(
+        routes=routes,
+        middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])]
+    )
+
+async def stream_completion(stream, fmt, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """Async counterpart of llm_common.streaming.stream_completion.
+
+    Starlette cancels this generator when the client disconnects; the finally
+    block then closes the upstream stream.
+    """
+    stats = StreamStats()
+    chunks = stream.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(chunks.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=heartbeat_interval)
+            if not done:
+                yield encode_heartbeat(fmt)
+                continue
+
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                logger.error(f"Upstream stream failed: {e}")
+                yield encode_event("error", {"error": "The model stream failed"}, fmt)
+                return
+
+            if content := stats.record(chunk):
+                yield encode_event("content", {"content": content}, fmt)
+
+        yield encode_event("done", stats.summary(), fmt)
+    finally:
+        if pending is not None:
+            pending.cancel()
+        await stream.close()
+
+def streaming_response(stream, accept_header):
+    """Starlette response streaming a chat completion in the format the client accepts"""
+    fmt = negotiate_format(accept_header)
+    return StreamingResponse(stream_completion(stream, fmt), media_type=fmt, headers=STREAM_HEADERS)
@@ -0,0 +1,73 @@
+import numpy as np
+
+def to_blob(vector):
+    """Encode an embedding as a float32 blob for SQLite"""
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+class _Partition:
+    def __init__(self):
+        self.vectors = {}    # note_id -> unit-length vector
+        self._ids = None     # Cached id array and matrix, rebuilt lazily after changes
+        self._matrix = None
+
+    def matrix(self):
+        if self._matrix is None:
+            self._ids = np.fromiter(self.vectors, dtype=np.int64, count=len(self.vectors))
+            self._matrix = np.vstack(list(self.vectors.values()))
+        return self._ids, self._matrix
+
+    def invalidate(self):
+        self._ids = self._matrix = None
+
+class NoteVectorIndex:
+    """In-process cosine-similarity index over note embeddings.
+
+    Vectors are normalized on insert and kept in one NumPy matrix per
+    partition (e.g. per chat), so a search is a single matrix-vector product
+    over that partition's notes.
+    """
+
+    def __init__(self):
+        self.partitions = {}
+        self.note_partitions = {}  # note_id -> partition key, for removal by id
+
+    def __len__(self):
+        return len(self.note_partitions)
+
+    def add(self, partition, note_id, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        self.remove([note_id])
+        part = self.partitions.setdefault(partition, _Partition())
+        part.vectors[note_id] = vector / norm
+        part.invalidate()
+        self.note_partitions[note_id] = partition
+
+    def remove(self, note_ids):
+        for note_id in note_ids:
+            partition = self.note_partitions.pop(note_id, None)
+            if partition is None:
+                continue
+            part = self.partitions[partition]
+            del part.vectors[note_id]
+            part.invalidate()
+            if not part.vectors:
+                del self.partitions[partition]
+
+    def search(self, partition, vector, k=10, threshold=0.0):
+        """Return up to k (note_id, similarity) pairs at or above threshold, best first"""
+        part = self.partitions.get(partition)
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if part is None or not norm:
+            return []
+
+        ids, matrix = part.matrix()
+        scores = matrix @ (vector / norm)
+        top = np.argsort(-scores)[:k]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] >= threshold]
@@ -0,0 +1,119 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+SSE = "text/event-stream"
+NDJSON = "application/x-ndjson"
+
+# Send a keep-alive at least this often so proxies don't time out idle streams
+# and client disconnects are noticed even while the model is thinking
+HEARTBEAT_INTERVAL = 15.0
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+}
+
+def negotiate_format(accept_header):
+    """Pick SSE if the client asks for it, otherwise newline-delimited JSON"""
+    if accept_header and SSE in accept_header:
+        return SSE
+    return NDJSON
+
+def encode_event(event, data, fmt):
+    """Encode one event as an SSE frame or an NDJSON line"""
+    if fmt == SSE:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event, **data}) + "\n"
+
+def encode_heartbeat(fmt):
+    if fmt == SSE:
+        return ": heartbeat\n\n"
+    return encode_event("heartbeat", {}, fmt)
+
+class StreamStats:
+    """Latency and usage bookkeeping for one streamed completion"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token = None
+        self.chunks = 0
+        self.usage = None
+
+    def record(self, chunk):
+        """Update stats from a completion chunk and return its text, if any"""
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage.model_dump()
+        if chunk.choices and (content := chunk.choices[0].delta.content):
+            if self.first_token is None:
+                self.first_token = time.monotonic()
+            self.chunks += 1
+            return content
+        return None
+
+    def summary(self):
+        return {
+            "usage": self.usage,
+            "chunks": self.chunks,
+            "time_to_first_token_ms": round((self.first_token - self.started) * 1000) if self.first_token else None,
+            "total_ms": round((time.monotonic() - self.started) * 1000),
+        }
+
+def stream_completion(stream, fmt, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """Turn an OpenAI chat completion stream into SSE or NDJSON events.
+
+    The upstream stream is read on a helper thread so heartbeats can be sent
+    while waiting for tokens. When the client disconnects, the server closes
+    this generator and the upstream request is closed with it, so we stop
+    paying for tokens nobody reads.
+    """
+    stats = StreamStats()
+    events = queue.Queue()
+    stopped = threading.Event()
+
+    def pump():
+        try:
+            for chunk in stream:
+                if stopped.is_set():
+                    return
+                events.put(("chunk", chunk))
+            events.put(("end", None))
+        except Exception as e:
+            events.put(("error", e))
+
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        while True:
+            try:
+                kind, item = events.get(timeout=heartbeat_interval)
+            except queue.Empty:
+                yield encode_heartbeat(fmt)
+                continue
+
+            if kind == "chunk":
+                if content := stats.record(item):
+                    yield encode_event("content", {"content": content}, fmt)
+            elif kind == "error":
+                logger.error(f"Upstream stream failed: {item}")
+                yield encode_event("error", {"error": "The model stream failed"}, fmt)
+                return
+            else:
+                break
+
+        yield encode_event("done", stats.summary(), fmt)
+    finally:
+        # Runs on normal completion and on GeneratorExit from a client disconnect
+        if not stopped.is_set():
+            stopped.set()
+            stream.close()
+
+def streaming_response(stream, accept_header):
+    """Flask response streaming a chat completion in the format the client accepts"""
+    fmt = negotiate_format(accept_header)
+    return Response(stream_completion(stream, fmt), mimetype=fmt, headers=STREAM_HEADERS)
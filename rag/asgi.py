@@ -0,0 +1,71 @@
+# Async serving mode: uvicorn asgi:app
+# Same routes and payloads as main.py. Retrieval reuses main.py's ingestor and
+# runs in Starlette's thread pool; the chat stream itself is a coroutine.
+import logging
+import os
+import sys
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.asgi import create_app, create_async_client, streaming_response
+from main import ingestor, admin_auth_error, SYSTEM_TEMPLATE, RETRIEVAL_MODE, RETRIEVAL_MODES
+
+logger = logging.getLogger(__name__)
+
+client = create_async_client()
+
+async def chat(request):
+    try:
+        data = await request.json()
+        messages = data.get('messages', [])
+        
+        if not messages:
+            return JSONResponse({"error": "No messages provided"}, status_code=400)
+            
+        # Extract latest user message
+        user_message = messages[-1]["content"]
+        
+        # Retrieve relevant context; "lexical" skips the embedding API entirely
+        retrieval_mode = data.get('retrieval', RETRIEVAL_MODE)
+        if retrieval_mode not in RETRIEVAL_MODES:
+            return JSONResponse({"error": f"Unknown retrieval mode: {retrieval_mode}"}, status_code=400)
+        docs = await run_in_threadpool(ingestor.search, user_message, k=3, mode=retrieval_mode)
+        context = "\n\n".join([d.page_content for d in docs])
+        
+        # Construct message history with the retrieved context
+        chat_messages = [
+            {"role": "system", "content": SYSTEM_TEMPLATE.format(context=context)},
+            *messages
+        ]
+
+        response = await client.chat.completions.create(
+            model="deepseek-chat",
+            messages=chat_messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        # SSE or NDJSON depending on the Accept header
+        return streaming_response(response, request.headers.get('accept'))
+
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {str(e)}")
+        return JSONResponse({"error": "An error occurred processing your request"}, status_code=500)
+
+async def admin_ingest(request):
+    if error := admin_auth_error(request.headers.get("authorization")):
+        message, status = error
+        return JSONResponse({"error": message}, status_code=status)
+
+    try:
+        return JSONResponse(await run_in_threadpool(ingestor.sync))
+    except Exception as e:
+        logger.error(f"Error in ingest endpoint: {str(e)}")
+        return JSONResponse({"error": "An error occurred while ingesting"}, status_code=500)
+
+app = create_app([
+    Route('/chat', chat, methods=['POST']),
+    Route('/admin/ingest', admin_ingest, methods=['POST']),
+])
@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# The cache's row count is tracked in memory and re-read from SQLite every this many writes
+RECOUNT_PUTS = 1000
+
+# Custom embedding class for Deepseek
+class DeepseekEmbeddings(Embeddings):
+    def __init__(self, client, model="text-embedding-002",  # Verify correct model name with Deepseek docs
+                 batch_size=64, max_workers=4, max_retries=3, backoff=1.0):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def embed_documents(self, texts):
+        """Embed texts in batches, running several batches concurrently"""
+        if not texts:
+            return []
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+
+        # executor.map yields results in submission order, so output order matches input
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            return [vector for batch in executor.map(self._embed_batch, batches) for vector in batch]
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
+
+    def _embed_batch(self, batch):
+        """Embed one batch with a single request, retrying with exponential backoff"""
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.embeddings.create(
+                    input=batch,
+                    model=self.model
+                )
+                # Each item carries the index of its input; don't rely on response order
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                logger.warning(f"Embedding batch of {len(batch)} failed (attempt {attempt + 1}), retrying in {delay}s: {e}")
+                time.sleep(delay)
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed embedding cache around any Embeddings implementation.
+
+    Vectors are keyed by a hash of the model name and whitespace-normalized
+    text and stored as float32 blobs in SQLite, with least-recently-used
+    entries evicted once the cache grows past max_entries. Hits only update
+    last_used in memory; the timestamps are written at most once every
+    touch_interval seconds, or before an eviction, so reads don't commit.
+    """
+
+    def __init__(self, embeddings, path="embedding_cache.db", max_entries=100_000, touch_interval=60):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, 'model', type(embeddings).__name__)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.touch_interval = touch_interval
+        self._touched = {}  # key -> last_used not yet written
+        self._flushed = time.monotonic()
+        # Flask serves requests from several threads, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        # Running row count, so misses don't scan the table to enforce max_entries
+        self._count = self._count_entries()
+        self._puts = 0
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        vectors = self._get_many(keys)
+
+        # Only embed texts we haven't seen, and each distinct text only once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self._put_many(fresh)
+            vectors.update(fresh)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text)
+        cached = self._get_many([key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._put_many({key: vector})
+        return vector
+
+    def _key(self, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model}\0{normalized}".encode('utf-8')).hexdigest()
+
+    def _get_many(self, keys):
+        """Fetch cached vectors for keys and mark them as recently used"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                cursor = self.conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN ({})".format(','.join('?' for _ in chunk)),
+                    chunk
+                )
+                for key, blob in cursor:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._touched.update((key, now) for key in found)
+                if time.monotonic() - self._flushed >= self.touch_interval:
+                    self._flush_touched()
+                    self.conn.commit()
+        return found
+
+    def _flush_touched(self):
+        """Write pending last_used updates; the caller holds the lock and commits"""
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._flushed = time.monotonic()
+
+    def _put_many(self, vectors):
+        """Store new vectors and evict the least recently used past the size cap"""
+        now = time.time()
+        with self._lock:
+            # Keys are content hashes, so an existing row already holds the same vector
+            inserted = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array('f', vector).tobytes(), now) for key, vector in vectors.items()]
+            ).rowcount
+            if inserted < len(vectors):
+                # Some were cached by a concurrent miss meanwhile; they count as used now
+                self._touched.update((key, now) for key in vectors)
+            self._puts += 1
+            if self._puts % RECOUNT_PUTS == 0:
+                # Other processes (the ingest CLI) may share the file, so resync now and then
+                self._count = self._count_entries()
+            else:
+                self._count += inserted
+            if self._count > self.max_entries:
+                # Eviction must see recent hits
+                self._flush_touched()
+                self._count -= self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (self._count - self.max_entries,)
+                ).rowcount
+            self.conn.commit()
+
+    def _count_entries(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
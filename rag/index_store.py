@@ -0,0 +1,63 @@
+import hashlib
+import json
+import logging
+import os
+
+from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "faiss_index"
+MANIFEST_NAME = "manifest.json"
+
+def file_sha256(path):
+    """Hash a file in blocks so large corpora aren't read into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(index_dir=INDEX_DIR):
+    """Return the manifest of the persisted index, or None if there isn't one"""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def save_manifest(manifest, index_dir=INDEX_DIR):
+    """Write the manifest atomically so a crash never leaves a half-written one"""
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def save_index(vector_store, manifest, index_dir=INDEX_DIR):
+    """Persist vectors + docstore, then the manifest last as the commit marker.
+
+    The old manifest is removed first: if the process dies while the index is
+    being overwritten, there is no manifest to pair the new index with, and
+    the next start rebuilds instead of re-adding chunks that are already there.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    try:
+        os.remove(os.path.join(index_dir, MANIFEST_NAME))
+    except FileNotFoundError:
+        pass
+    vector_store.save_local(index_dir)
+    save_manifest(manifest, index_dir)
+
+def load_index(embeddings, index_dir=INDEX_DIR):
+    """Load the persisted vector store, or None if it is missing or unreadable"""
+    try:
+        logger.info(f"Loading vector index from {index_dir}")
+        return FAISS.load_local(
+            index_dir,
+            embeddings,
+            allow_dangerous_deserialization=True  # We wrote this pickle ourselves
+        )
+    except Exception as e:
+        logger.warning(f"Failed to load persisted index: {e}")
+        return None
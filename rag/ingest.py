@@ -0,0 +1,264 @@
+import argparse
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_community.document_loaders import TextLoader
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+
+import index_store
+from bm25 import BM25Index, reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+# Files and directories that make up the corpus, relative to the rag/ directory
+CORPUS_PATHS = ["art_of_war.txt", "posts"]
+CORPUS_EXTENSIONS = (".txt",)
+
+# Chunking settings; changing any of these triggers a full rebuild
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Embed and add chunks in groups of this size so memory stays bounded on big deltas
+FLUSH_CHUNKS = 256
+
+# Retrieval modes: "hybrid" fuses BM25 and vector results, "lexical" skips the
+# embedding API entirely, "vector" is plain similarity search
+RETRIEVAL_MODES = ("hybrid", "lexical", "vector")
+
+# Hybrid search falls back to lexical-only if the query embedding takes longer than this
+EMBED_TIMEOUT = float(os.getenv("RAG_EMBED_TIMEOUT", "2.0"))
+
+def scan_corpus(paths, extensions=CORPUS_EXTENSIONS):
+    """Map every corpus file under paths to its modification time"""
+    files = {}
+    for path in paths:
+        if os.path.isfile(path):
+            files[path] = os.path.getmtime(path)
+            continue
+        for root, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.endswith(extensions):
+                    full_path = os.path.join(root, name)
+                    files[full_path] = os.path.getmtime(full_path)
+    return files
+
+class Ingestor:
+    """Keeps a live FAISS store and BM25 index in sync with the corpus on disk.
+
+    The manifest records, per file, its mtime, content hash and the docstore
+    ids of its chunks, so a sync only embeds new or changed files and deletes
+    the chunks of changed or removed ones. The BM25 index holds the same
+    chunks under the same ids and is rebuilt from the docstore on startup.
+    """
+
+    def __init__(self, embeddings, corpus_paths=CORPUS_PATHS, index_dir=index_store.INDEX_DIR,
+                 chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, full_rebuild=False):
+        self.embeddings = embeddings
+        self.corpus_paths = corpus_paths
+        self.index_dir = index_dir
+        self.settings = {
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "embedding_model": embeddings.model,
+        }
+        self.splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+        # One sync at a time; the store lock only guards short reads/writes of the index
+        # so searches aren't blocked while a sync waits on the embedding API
+        self._sync_lock = threading.Lock()
+        self._store_lock = threading.Lock()
+
+        self.vector_store = None
+        self.lexical_index = BM25Index()
+        self.manifest = {**self.settings, "files": {}}
+        manifest = index_store.load_manifest(index_dir)
+        if not full_rebuild and self._is_compatible(manifest):
+            self.vector_store = index_store.load_index(embeddings, index_dir)
+            if self.vector_store is not None:
+                self.manifest = manifest
+                for doc_id in self.vector_store.index_to_docstore_id.values():
+                    self.lexical_index.add(doc_id, self.vector_store.docstore.search(doc_id).page_content)
+
+        # Query embeddings run here so hybrid search can give up on a slow endpoint
+        self._embed_executor = ThreadPoolExecutor(max_workers=4)
+
+    def _is_compatible(self, manifest):
+        return (
+            manifest is not None
+            and "files" in manifest
+            and all(manifest.get(key) == value for key, value in self.settings.items())
+        )
+
+    def search(self, query, k=4, mode="hybrid"):
+        """Retrieve the k most relevant chunks for query.
+
+        In hybrid mode, BM25 and vector rankings are merged with reciprocal-rank
+        fusion; if the embedding call fails or exceeds EMBED_TIMEOUT the lexical
+        ranking is used on its own.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+
+        # Over-fetch candidates so fusion has something to work with
+        candidates = k * 4 if mode == "hybrid" else k
+        rankings = []
+
+        vector = None
+        if mode != "lexical":
+            future = self._embed_executor.submit(self.embeddings.embed_query, query)
+            try:
+                vector = future.result(timeout=EMBED_TIMEOUT if mode == "hybrid" else None)
+            except Exception as e:
+                if mode == "vector":
+                    raise
+                logger.warning(f"Query embedding unavailable, using lexical retrieval only: {e!r}")
+
+        # Rank and look up under one lock, so a concurrent sync can't delete ids in between
+        with self._store_lock:
+            if self.vector_store is None:
+                return []
+            if vector is not None:
+                rankings.append(self._vector_search(vector, candidates))
+            if mode != "vector":
+                rankings.append([doc_id for doc_id, _ in self.lexical_index.search(query, candidates)])
+            doc_ids = rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(rankings)
+            docs = []
+            for doc_id in doc_ids:
+                # InMemoryDocstore.search returns an error string for unknown ids
+                doc = self.vector_store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    docs.append(doc)
+                    if len(docs) == k:
+                        break
+            return docs
+
+    def _vector_search(self, vector, k):
+        """Nearest-neighbour search returning docstore ids, best first; the caller holds _store_lock"""
+        _, indices = self.vector_store.index.search(np.array([vector], dtype=np.float32), k)
+        return [self.vector_store.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+    def sync(self):
+        """Apply new, changed and deleted corpus files to the store and persist it"""
+        with self._sync_lock:
+            known = self.manifest["files"]
+            current = scan_corpus(self.corpus_paths)
+            summary = {"added": [], "changed": [], "removed": [], "unchanged": 0}
+            stale_paths, stale_ids = [], []
+            pending = []
+            touched = False
+
+            for path in sorted(set(known) - set(current)):
+                stale_paths.append(path)
+                stale_ids.extend(known[path]["ids"])
+                summary["removed"].append(path)
+
+            for path, mtime in sorted(current.items()):
+                entry = known.get(path)
+                if entry and entry["mtime"] == mtime:
+                    summary["unchanged"] += 1
+                    continue
+
+                # mtime moved, but only re-embed if the content actually changed
+                digest = index_store.file_sha256(path)
+                if entry and entry["sha256"] == digest:
+                    entry["mtime"] = mtime
+                    summary["unchanged"] += 1
+                    touched = True
+                    continue
+
+                if entry:
+                    stale_paths.append(path)
+                    stale_ids.extend(entry["ids"])
+                    summary["changed"].append(path)
+                else:
+                    summary["added"].append(path)
+                pending.append((path, mtime, digest))
+
+            try:
+                if stale_ids:
+                    with self._store_lock:
+                        if self.vector_store is not None:
+                            self.vector_store.delete(stale_ids)
+                        for doc_id in stale_ids:
+                            self.lexical_index.remove(doc_id)
+                    # Forget the old chunks only once they are gone from the store; a
+                    # changed file whose new chunks then fail to add is retried as new
+                    for path in stale_paths:
+                        known.pop(path)
+                    touched = True
+
+                batch, entries = [], {}
+                for path, mtime, digest in pending:
+                    chunks = self.splitter.split_documents(TextLoader(path).load())
+                    entry = {"mtime": mtime, "sha256": digest, "ids": [str(uuid.uuid4()) for _ in chunks]}
+                    batch.extend(zip(entry["ids"], chunks))
+                    entries[path] = entry
+                    if len(batch) >= FLUSH_CHUNKS:
+                        self._add_chunks(batch)
+                        known.update(entries)
+                        batch, entries = [], {}
+                        touched = True
+                if batch:
+                    self._add_chunks(batch)
+                    touched = True
+                known.update(entries)
+            finally:
+                # Persist whatever was applied, even if a later batch failed
+                if touched:
+                    self._save()
+
+            logger.info(
+                f"Ingest: {len(summary['added'])} added, {len(summary['changed'])} changed, "
+                f"{len(summary['removed'])} removed, {summary['unchanged']} unchanged"
+            )
+            return summary
+
+    def _add_chunks(self, batch):
+        """Embed (outside the store lock) and add (id, document) pairs to the store"""
+        ids = [doc_id for doc_id, _ in batch]
+        texts = [doc.page_content for _, doc in batch]
+        metadatas = [doc.metadata for _, doc in batch]
+        vectors = self.embeddings.embed_documents(texts)
+
+        with self._store_lock:
+            if self.vector_store is None:
+                self.vector_store = FAISS.from_embeddings(
+                    list(zip(texts, vectors)), self.embeddings, metadatas=metadatas, ids=ids
+                )
+            else:
+                self.vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+            for doc_id, text in zip(ids, texts):
+                self.lexical_index.add(doc_id, text)
+
+    def _save(self):
+        with self._store_lock:
+            if self.vector_store is not None:
+                index_store.save_index(self.vector_store, self.manifest, self.index_dir)
+
+def main():
+    """Sync the on-disk index with the corpus. Use POST /admin/ingest while the server is running."""
+    from dotenv import load_dotenv
+    from openai import OpenAI
+    from embeddings import DeepseekEmbeddings, CachedEmbeddings
+
+    parser = argparse.ArgumentParser(description="Incrementally ingest the RAG corpus")
+    parser.add_argument("--full", action="store_true", help="ignore the persisted index and rebuild it")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    client = OpenAI(
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url="https://api.deepseek.com"
+    )
+    ingestor = Ingestor(CachedEmbeddings(DeepseekEmbeddings(client)), full_rebuild=args.full)
+    print(ingestor.sync())
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,16 @@
 # app.py
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify
 from flask_cors import CORS
 from openai import OpenAI
 from dotenv import load_dotenv
+import hmac
 import os
-import json
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import CharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_core.embeddings import Embeddings
-
-# Custom embedding class for Deepseek
-class DeepseekEmbeddings(Embeddings):
-    def __init__(self, client):
-        self.client = client
-        
-    def embed_documents(self, texts):
-        return [self.embed_query(text) for text in texts]
-    
-    def embed_query(self, text):
-        response = self.client.embeddings.create(
-            input=text,
-            model="text-embedding-002"  # Verify correct model name with Deepseek docs
-        )
-        return response.data[0].embedding
+import sys
+from embeddings import DeepseekEmbeddings, CachedEmbeddings
+from ingest import Ingestor, RETRIEVAL_MODES
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.streaming import streaming_response
 
 # Initialize application
 load_dotenv()
@@ -36,17 +23,14 @@ client = OpenAI(
     base_url="https://api.deepseek.com"
 )
 
-# Load and process The Art of War text
-loader = TextLoader("art_of_war.txt")
-documents = loader.load()
+# Load the persisted vector store and ingest only corpus files that changed since last run.
+# Embeddings go through a local cache so repeat queries and unchanged chunks are free.
+embeddings = CachedEmbeddings(DeepseekEmbeddings(client))
+ingestor = Ingestor(embeddings)
+ingestor.sync()
 
-# Split text into chunks
-text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-texts = text_splitter.split_documents(documents)
-
-# Create vector store with Deepseek embeddings
-embeddings = DeepseekEmbeddings(client)
-vector_store = FAISS.from_documents(texts, embeddings)
+# Default retrieval mode for /chat; requests can override it with a "retrieval" field
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
 
 # System prompt template
 SYSTEM_TEMPLATE = """You are Sun Tzu's digital incarnation. Respond to questions using wisdom from The Art of War. 
@@ -68,8 +52,11 @@ def chat():
         # Extract latest user message
         user_message = messages[-1]["content"]
         
-        # Retrieve relevant context
-        docs = vector_store.similarity_search(user_message, k=3)
+        # Retrieve relevant context; "lexical" skips the embedding API entirely
+        retrieval_mode = data.get('retrieval', RETRIEVAL_MODE)
+        if retrieval_mode not in RETRIEVAL_MODES:
+            return jsonify({"error": f"Unknown retrieval mode: {retrieval_mode}"}), 400
+        docs = ingestor.search(user_message, k=3, mode=retrieval_mode)
         context = "\n\n".join([d.page_content for d in docs])
         
         # Prepare system message with context
@@ -85,19 +72,41 @@ def chat():
         response = client.chat.completions.create(
             model="deepseek-chat",
             messages=chat_messages,
-            stream=True
+            stream=True,
+            stream_options={"include_usage": True}
         )
 
-        def generate():
-            for chunk in response:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield json.dumps({"content": chunk.choices[0].delta.content})
-
-        return Response(generate(), mimetype="application/json")
+        # SSE or NDJSON depending on the Accept header
+        return streaming_response(response, request.headers.get('Accept'))
 
     except Exception as e:
         app.logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({"error": "An error occurred processing your request"}), 500
 
+def admin_auth_error(authorization):
+    """(message, status) if a request may not use admin endpoints, else None.
+
+    Fails closed: without RAG_ADMIN_TOKEN the admin endpoints are disabled.
+    """
+    admin_token = os.getenv("RAG_ADMIN_TOKEN")
+    if not admin_token:
+        return "Admin endpoints are disabled", 403
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {admin_token}".encode()):
+        return "Unauthorized", 401
+    return None
+
+# Admin endpoint to pick up new/changed/deleted corpus files without a restart
+@app.route('/admin/ingest', methods=['POST'])
+def admin_ingest():
+    if error := admin_auth_error(request.headers.get("Authorization")):
+        message, status = error
+        return jsonify({"error": message}), status
+
+    try:
+        return jsonify(ingestor.sync())
+    except Exception as e:
+        app.logger.error(f"Error in ingest endpoint: {str(e)}")
+        return jsonify({"error": "An error occurred while ingesting"}), 500
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
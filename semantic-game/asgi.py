@@ -0,0 +1,86 @@
+# Async serving mode: uvicorn asgi:app
+# Same routes and payloads as main.py, with the game logic shared via game.py.
+import os
+import sys
+import json
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from game import GameState, related_words_prompt, parse_related_words, choose_target_word
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.asgi import create_app, create_async_client
+
+load_dotenv()
+
+client = create_async_client()
+
+async def get_related_words(seed_word, difficulty):
+    """Get semantically related words based on seed word and difficulty"""
+    try:
+        response = await client.chat.completions.create(
+            model="deepseek-chat",
+            messages=[{"role": "user", "content": related_words_prompt(seed_word, difficulty)}],
+            stream=False
+        )
+        return parse_related_words(response.choices[0].message.content)
+    except Exception as e:
+        print(f"Error generating related words: {e}")
+        return []
+
+async def get_target_word(seed_word=None, difficulty='medium'):
+    """Get target word based on seed word and difficulty"""
+    related_words = await get_related_words(seed_word, difficulty) if seed_word else []
+    return choose_target_word(related_words)
+
+game = GameState()
+
+async def start_game(request):
+    data = await request.json()
+    seed_word = data.get('seed_word')
+    difficulty = data.get('difficulty', 'medium')
+
+    game.start(await get_target_word(seed_word, difficulty), seed_word, difficulty)
+
+    return JSONResponse({
+        "status": "success",
+        "message": f"Game started with seed: {seed_word}, difficulty: {difficulty}"
+    })
+
+async def give_up(request):
+    current_word = game.next_word(await get_target_word())
+    return JSONResponse({
+        "old_word": current_word,
+        "new_word": game.target_word,
+        "message": f"The word was: {current_word}. New word selected!"
+    })
+
+async def chat(request):
+    data = await request.json()
+    messages = data.get('messages', [])
+
+    filtered_messages = [msg for msg in messages if msg.get("role") != "system"]
+    messages_with_system = [game.system_message] + filtered_messages
+
+    try:
+        response = await client.chat.completions.create(
+            model="deepseek-chat",
+            messages=messages_with_system,
+            stream=False
+        )
+
+        try:
+            response_data = game.check_guess(response.choices[0].message.content)
+        except json.JSONDecodeError:
+            return JSONResponse({"error": "Invalid response format from AI"}, status_code=500)
+
+        return JSONResponse({"content": json.dumps(response_data)})
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+app = create_app([
+    Route('/start-game', start_game, methods=['POST']),
+    Route('/give-up', give_up, methods=['POST']),
+    Route('/chat', chat, methods=['POST']),
+])
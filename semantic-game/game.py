@@ -0,0 +1,114 @@
+import json
+import random
+from functools import lru_cache
+
+# Define tighter similarity thresholds based on difficulty
+SIMILARITY_RANGES = {
+    'easy': (0.9, 1.0),   # Very similar words, same category
+    'medium': (0.8, 0.9), # Similar words, same general domain
+    'hard': (0.7, 0.8)    # Related words, same broad context
+}
+
+FALLBACK_WORDS = ["apple", "ocean", "music", "light", "dream", "cloud", "earth",
+                  "smile", "stone", "water", "heart", "moon", "sun", "tree",
+                  "flower", "river", "mountain", "star", "fire", "wind", "book",
+                  "computer", "language", "coffee", "guitar", "castle", "forest",
+                  "window", "planet", "mirror", "garden", "secret", "shadow",
+                  "winter", "summer", "spring", "autumn", "journey", "mystery",
+                  "whisper", "bottle", "letter", "silence", "moment", "history"]
+
+def is_valid_word(word):
+    return word.isalpha() and 3 <= len(word) <= 12
+
+def related_words_prompt(seed_word, difficulty):
+    """Prompt asking for semantically related words based on seed word and difficulty"""
+    # Get similarity range based on difficulty
+    min_sim, max_sim = SIMILARITY_RANGES.get(difficulty, (0.8, 0.9))
+
+    return f"""Generate 10 words that are semantically related to '{seed_word}'.
+    The words should:
+    1. Have a similarity score between {min_sim} and {max_sim}
+    2. Be in the same semantic category and part of speech
+    3. Exist in the same conceptual universe
+    4. Be appropriate for a word guessing game
+    5. Be common enough for most players to know
+    Return ONLY a JSON array of words, no other text or formatting."""
+
+def parse_related_words(llm_response):
+    """Parse the model's JSON array into valid game words"""
+    words = json.loads(llm_response)
+    return [w.lower() for w in words if is_valid_word(w)]
+
+@lru_cache(maxsize=1)
+def dictionary_words():
+    """Valid words from the system dictionary, read once per process"""
+    with open('/usr/share/dict/words', 'r') as f:
+        words = [word.strip().lower() for word in f]
+        return [w for w in words if is_valid_word(w)]
+
+def random_word():
+    """Random target word, falling back to a built-in list without a system dictionary"""
+    try:
+        return random.choice(dictionary_words())
+    except Exception as e:
+        print(f"Error loading system dictionary: {e}")
+        return random.choice(FALLBACK_WORDS)
+
+def choose_target_word(related_words):
+    """Pick from the related words, or a random word if there are none"""
+    if related_words:
+        return random.choice(related_words)
+    return random_word()
+
+def game_master_message(target_word, seed_word=None, difficulty=None):
+    """System message telling the model which word the player is guessing"""
+    intro = f"The target word is '{target_word}'"
+    if seed_word is not None:
+        intro += f" and is related to the seed word '{seed_word}' with {difficulty} difficulty"
+    return {
+        "role": "system",
+        "content": f"""You are a word guessing game master. {intro}.
+    For each user guess, respond ONLY with a JSON object containing:
+    1. 'percentage' (0-100 number estimating similarity to target)
+    2. 'hint' (a helpful but not overly obvious clue that:
+        - Points the user in the right direction
+        - References their guess and how it relates to the target
+        - Provides meaningful context about the target word
+        - Avoids being too direct or revealing)
+    Example: {{"percentage": 75, "hint": "Your guess 'fruit' is close - the target is also something that grows on trees, but it's specifically a type of citrus"}}
+    Do NOT include any other text or formatting."""
+    }
+
+class GameState:
+    """Current target word and the system message describing it"""
+
+    def __init__(self):
+        self.target_word = None
+        self.seed_word = None
+        self.difficulty = 'medium'
+        self.system_message = game_master_message(self.target_word)
+
+    def start(self, target_word, seed_word, difficulty):
+        self.target_word = target_word
+        self.seed_word = seed_word
+        self.difficulty = difficulty
+        self.system_message = game_master_message(target_word, seed_word, difficulty)
+
+    def next_word(self, target_word):
+        """Switch to a new target word; returns the previous one"""
+        previous_word = self.target_word
+        self.target_word = target_word
+        self.system_message = game_master_message(target_word)
+        return previous_word
+
+    def check_guess(self, llm_response):
+        """Parse the model's verdict, moving to a new word on a correct guess.
+
+        Raises json.JSONDecodeError if the response isn't valid JSON.
+        """
+        response_data = json.loads(llm_response)
+        # Check if guess was correct (100% similarity)
+        if response_data.get('percentage', 0) == 100:
+            self.next_word(random_word())
+            response_data['success'] = "Correct! New word selected. Keep guessing!"
+        return response_data
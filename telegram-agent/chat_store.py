@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import time
+import logging
+from collections import OrderedDict
+from conversation import Conversation
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_CHATS = int(os.getenv("CHAT_CACHE_SIZE", "1000"))
+IDLE_SECONDS = float(os.getenv("CHAT_IDLE_SECONDS", "1800"))  # Evict chats idle this long
+EVICT_INTERVAL = 300
+
+class ChatState:
+    """Everything the bot remembers about one chat"""
+
+    def __init__(self, conversation, pending_command=None):
+        self.conversation = conversation
+        self.pending_command = pending_command  # Command awaiting a yes/no confirmation
+
+    def to_json(self):
+        return json.dumps(
+            {"conversation": self.conversation.to_dict(), "pending_command": self.pending_command},
+            separators=(",", ":")
+        )
+
+    @classmethod
+    def from_json(cls, system_message, data):
+        data = json.loads(data)
+        return cls(Conversation.from_dict(system_message, data["conversation"]), data.get("pending_command"))
+
+class ChatStore:
+    """Per-chat state persisted in notes.db, with an LRU working set in memory.
+
+    A chat's state is loaded on its first message after startup or eviction
+    and written through on save(), so evicting it only drops the in-memory
+    copy. The working set is capped at max_chats, and a background task
+    evicts chats idle for longer than idle_seconds.
+    """
+
+    def __init__(self, bot_data, max_chats=MAX_CACHED_CHATS, idle_seconds=IDLE_SECONDS):
+        self.bot_data = bot_data
+        self.max_chats = max_chats
+        self.idle_seconds = idle_seconds
+        self._cache = OrderedDict()  # chat_id -> (state, last used), least recently used first
+        self._loading = {}           # chat_id -> task, so concurrent misses load once
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._evict_idle())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def get(self, chat_id):
+        """The chat's state, loading it from the database on a cache miss"""
+        if chat_id in self._cache:
+            state, _ = self._cache.pop(chat_id)
+        else:
+            if chat_id not in self._loading:
+                self._loading[chat_id] = asyncio.create_task(self._load(chat_id))
+            try:
+                state = await self._loading[chat_id]
+            finally:
+                self._loading.pop(chat_id, None)
+            # Another caller may have cached it while this one waited
+            if chat_id in self._cache:
+                state, _ = self._cache.pop(chat_id)
+
+        self._cache[chat_id] = (state, time.monotonic())
+        while len(self._cache) > self.max_chats:
+            self._cache.popitem(last=False)
+        return state
+
+    async def save(self, chat_id, state):
+        """Persist a chat's state (even if it has been evicted from the cache meanwhile)"""
+        await self.bot_data['db'].save_chat_state(chat_id, state.to_json())
+
+    async def _load(self, chat_id):
+        system_message = self.bot_data['system_message']
+        try:
+            data = await self.bot_data['db'].get_chat_state(chat_id)
+            if data is not None:
+                return ChatState.from_json(system_message, data)
+        except Exception as e:
+            logger.error(f"Error loading state for chat {chat_id}: {e}")
+        return ChatState(Conversation(system_message))
+
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(EVICT_INTERVAL)
+            cutoff = time.monotonic() - self.idle_seconds
+            # Least recently used first, so stop at the first recent one
+            while self._cache:
+                chat_id, (_, last_used) = next(iter(self._cache.items()))
+                if last_used > cutoff:
+                    break
+                del self._cache[chat_id]
@@ -1,16 +1,41 @@
 import logging
 from database import NoteDatabase
+from llm_handler import find_related_notes, index_note, run_in_background
+from conversation import Conversation
 
 logger = logging.getLogger(__name__)
 
+async def new_conversation(context, chat_id):
+    store = context.bot_data['chat_store']
+    state = await store.get(chat_id)
+    state.conversation = Conversation(context.bot_data['system_message'])
+    await store.save(chat_id, state)
+
+async def set_pending_command(context, chat_id, command):
+    """Remember a command until the user confirms it"""
+    store = context.bot_data['chat_store']
+    state = await store.get(chat_id)
+    state.pending_command = command
+    await store.save(chat_id, state)
+
+async def matched_notes_list(db, note_ids, width=100):
+    """The matched notes as a bullet list for a confirmation prompt, best match first"""
+    contents = dict(await db.get_notes_by_ids(note_ids))
+    lines = []
+    for note_id in note_ids:
+        content = contents.get(note_id)
+        if content is not None:
+            lines.append(f"- {content if len(content) <= width else content[:width - 1] + '…'}")
+    return "\n".join(lines)
+
 async def start(update, context):
     chat_id = update.effective_chat.id
-    context.chat_data['conversation'] = [context.bot_data['system_message']]
+    await new_conversation(context, chat_id)
     await update.message.reply_text("Hello! I'm your AI assistant. How can I help you today?")
 
 async def reset(update, context):
     chat_id = update.effective_chat.id
-    context.chat_data['conversation'] = [context.bot_data['system_message']]
+    await new_conversation(context, chat_id)
     await update.message.reply_text("Conversation reset. How can I assist you?")
 
 async def help(update, context):
@@ -36,8 +61,9 @@ async def save_note(update, context):
     
     try:
         db = context.bot_data['db']
-        success = await db.add_note(chat_id, note_text)
-        if success:
+        note_id = await db.add_note(chat_id, note_text)
+        if note_id:
+            run_in_background(context.bot_data, index_note(context.bot_data, chat_id, [note_id], note_text))
             await update.message.reply_text("📝 Note saved successfully!")
         else:
             await update.message.reply_text("⚠️ Failed to save note, please try again")
@@ -73,21 +99,18 @@ async def remove_notes(update, context):
         return
     
     try:
-        db = context.bot_data['db']
-        client = context.bot_data['client']
-        
-        # Get all notes and find related ones
-        all_notes = await db.get_all_notes(chat_id)
-        note_ids = await context.bot_data['llm_handler'].find_related_notes(client, topic, all_notes)
+        # Local vector search over this chat's notes
+        note_ids = await find_related_notes(context.bot_data, chat_id, topic)
         
         if not note_ids:
             await update.message.reply_text(f"No notes found related to '{topic}'")
             return
             
-        # Show confirmation
-        context.user_data['pending_command'] = ('/remove_notes', topic, note_ids)
+        # Show the matches, so unrelated notes aren't deleted unseen
+        notes_list = await matched_notes_list(context.bot_data['db'], note_ids)
+        await set_pending_command(context, chat_id, ['/remove_notes', topic, note_ids])
         await update.message.reply_text(
-            f"⚠️ Found {len(note_ids)} notes related to '{topic}'. "
+            f"⚠️ Found {len(note_ids)} notes related to '{topic}':\n{notes_list}\n\n"
             "Are you sure you want to delete them? (yes/no)"
         )
     except Exception as e:
@@ -108,21 +131,18 @@ async def edit_notes(update, context):
     new_content = ' '.join(context.args[1:])
     
     try:
-        db = context.bot_data['db']
-        client = context.bot_data['client']
-        
-        # Get all notes and find related ones
-        all_notes = await db.get_all_notes(chat_id)
-        note_ids = await context.bot_data['llm_handler'].find_related_notes(client, topic, all_notes)
+        # Local vector search over this chat's notes
+        note_ids = await find_related_notes(context.bot_data, chat_id, topic)
         
         if not note_ids:
             await update.message.reply_text(f"No notes found related to '{topic}'")
             return
             
-        # Show confirmation
-        context.user_data['pending_command'] = ('/edit_notes', topic, note_ids, new_content)
+        # Show the matches, so unrelated notes aren't overwritten unseen
+        notes_list = await matched_notes_list(context.bot_data['db'], note_ids)
+        await set_pending_command(context, chat_id, ['/edit_notes', topic, note_ids, new_content])
         await update.message.reply_text(
-            f"⚠️ Found {len(note_ids)} notes related to '{topic}'. "
+            f"⚠️ Found {len(note_ids)} notes related to '{topic}':\n{notes_list}\n\n"
             f"Are you sure you want to update them to: '{new_content}'? (yes/no)"
         )
     except Exception as e:
@@ -131,28 +151,30 @@ async def edit_notes(update, context):
 
 async def execute_remove_notes(update, context):
     """Execute the removal of notes after confirmation"""
-    _, topic, note_ids = context.user_data['pending_command']
+    _, topic, note_ids = (await context.bot_data['chat_store'].get(update.effective_chat.id)).pending_command
     db = context.bot_data['db']
     
-    success_count = 0
-    for note_id in note_ids:
-        if await db.delete_note(note_id):
-            success_count += 1
+    # One transaction for the whole set
+    deleted = await db.delete_notes(note_ids)
+    # Only the notes that were actually deleted; the rest keep their index entries
+    context.bot_data['note_index'].remove(deleted)
     
     await update.message.reply_text(
-        f"✅ Removed {success_count}/{len(note_ids)} notes related to '{topic}'"
+        f"✅ Removed {len(deleted)}/{len(note_ids)} notes related to '{topic}'"
     )
 
 async def execute_edit_notes(update, context):
     """Execute the editing of notes after confirmation"""
-    _, topic, note_ids, new_content = context.user_data['pending_command']
+    _, topic, note_ids, new_content = (await context.bot_data['chat_store'].get(update.effective_chat.id)).pending_command
     db = context.bot_data['db']
     
-    success_count = 0
-    for note_id in note_ids:
-        if await db.update_note(note_id, new_content):
-            success_count += 1
+    # One transaction for the whole set
+    updated = await db.update_notes(note_ids, new_content)
+    # Every edited note now has the same content, so embed it once; notes deleted
+    # since the confirmation was asked for must not come back into the index
+    if updated:
+        await index_note(context.bot_data, update.effective_chat.id, updated, new_content)
     
     await update.message.reply_text(
-        f"✅ Updated {success_count}/{len(note_ids)} notes related to '{topic}'"
+        f"✅ Updated {len(updated)}/{len(note_ids)} notes related to '{topic}'"
     )
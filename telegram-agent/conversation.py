@@ -0,0 +1,107 @@
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tokens of recent turns resent with every request; older turns are summarized
+TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "3000"))
+MIN_RECENT_MESSAGES = 2  # Always kept verbatim, even over budget
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep facts about the user, their preferences, decisions made and open questions. Drop small talk.
+Respond ONLY with the updated summary, under 200 words.
+
+Current summary:
+{summary}
+
+Messages to fold in:
+{transcript}"""
+
+def estimate_tokens(message):
+    """Rough token count for a chat message (~4 characters per token plus role overhead).
+
+    Deepseek's tokenizer isn't available locally; this only needs to keep
+    request size bounded, not match billing exactly.
+    """
+    return len(message["content"]) // 4 + 4
+
+class Conversation:
+    """Chat history kept under a token budget.
+
+    The newest turns are sent verbatim while they fit in token_budget. Older
+    turns move to a pending list that a background task folds into a rolling
+    summary, which is sent as a system message after the main system message.
+    """
+
+    def __init__(self, system_message, token_budget=TOKEN_BUDGET):
+        self.system_message = system_message
+        self.token_budget = token_budget
+        self.summary = ""
+        self.turns = []
+        self.pending = []   # Dropped from the window, not yet in the summary
+        self._tokens = 0
+        self._summary_task = None
+
+    def to_dict(self):
+        """Serializable state; the system message and budget come from config"""
+        return {"summary": self.summary, "turns": self.turns, "pending": self.pending}
+
+    @classmethod
+    def from_dict(cls, system_message, data):
+        conversation = cls(system_message)
+        conversation.summary = data.get("summary", "")
+        conversation.pending = data.get("pending", [])
+        for message in data.get("turns", []):
+            conversation.append(message["role"], message["content"])
+        return conversation
+
+    def append(self, role, content):
+        message = {"role": role, "content": content}
+        self.turns.append(message)
+        self._tokens += estimate_tokens(message)
+        self._trim()
+
+    def _trim(self):
+        while self._tokens > self.token_budget and len(self.turns) > MIN_RECENT_MESSAGES:
+            message = self.turns.pop(0)
+            self._tokens -= estimate_tokens(message)
+            self.pending.append(message)
+
+        # If summarizing keeps failing, forget the oldest pending turns rather than grow forever
+        pending_tokens = sum(estimate_tokens(message) for message in self.pending)
+        while pending_tokens > 2 * self.token_budget:
+            pending_tokens -= estimate_tokens(self.pending.pop(0))
+
+    def messages(self):
+        """Messages for the next request: system message, summary, then recent turns"""
+        messages = [self.system_message]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        return messages + self.turns
+
+    def schedule_summary(self, client):
+        """Fold pending turns into the summary in the background, one refresh at a time"""
+        if self.pending and self._summary_task is None:
+            self._summary_task = asyncio.create_task(self._refresh_summary(client))
+
+    async def _refresh_summary(self, client):
+        try:
+            while self.pending:
+                folded = list(self.pending)
+                transcript = "\n".join(f"{message['role']}: {message['content']}" for message in folded)
+                completion = await client.chat.completions.create(
+                    model="deepseek-chat",
+                    messages=[{"role": "user", "content": SUMMARY_PROMPT.format(
+                        summary=self.summary or "(none yet)", transcript=transcript
+                    )}],
+                    temperature=0.2
+                )
+                self.summary = completion.choices[0].message.content.strip()
+                # Pending turns may have changed meanwhile; only drop the ones folded in
+                folded_ids = {id(message) for message in folded}
+                self.pending = [message for message in self.pending if id(message) not in folded_ids]
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {e}")
+        finally:
+            self._summary_task = None
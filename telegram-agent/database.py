@@ -1,98 +1,318 @@
+import asyncio
+import json
+import queue
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from contextlib import contextmanager
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Schema migrations in order. PRAGMA user_version holds the number already
+# applied; add new migrations to the end and never edit applied ones.
+MIGRATIONS = [
+    # 1: base schema (IF NOT EXISTS so databases created before migrations adopt it)
+    [
+        '''CREATE TABLE IF NOT EXISTS notes
+           (id INTEGER PRIMARY KEY,
+            chat_id INTEGER,
+            content TEXT,
+            created_at DATETIME)''',
+        '''CREATE TABLE IF NOT EXISTS categories
+           (id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE)''',
+        '''CREATE TABLE IF NOT EXISTS note_category
+           (note_id INTEGER,
+            category_id INTEGER,
+            PRIMARY KEY (note_id, category_id),
+            FOREIGN KEY (note_id) REFERENCES notes(id),
+            FOREIGN KEY (category_id) REFERENCES categories(id))''',
+        # float32 blobs for local semantic search
+        '''CREATE TABLE IF NOT EXISTS note_embeddings
+           (note_id INTEGER PRIMARY KEY,
+            embedding BLOB NOT NULL,
+            FOREIGN KEY (note_id) REFERENCES notes(id))''',
+    ],
+    # 2: indexes for the per-chat, newest-first and by-category reads
+    [
+        'CREATE INDEX IF NOT EXISTS idx_notes_chat_created ON notes(chat_id, created_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_note_category_category ON note_category(category_id, note_id)',
+    ],
+    # 3: durable background jobs (status is pending, running or dead; finished jobs are deleted)
+    [
+        '''CREATE TABLE jobs
+           (id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+        'CREATE INDEX idx_jobs_claim ON jobs(kind, status, run_after)',
+    ],
+    # 4: per-chat bot state (conversation, pending confirmation) as JSON
+    [
+        '''CREATE TABLE chat_state
+           (chat_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL)''',
+    ],
+    # 5: job leases, so jobs claimed by a process that died go back to the queue
+    [
+        'ALTER TABLE jobs ADD COLUMN claimed_at REAL',
+    ],
+]
+
+# Read queries on the hot path, shared with check_query_plans()
+RECENT_NOTES_SQL = '''
+    SELECT content, created_at
+    FROM notes
+    WHERE chat_id = ?
+    ORDER BY created_at DESC
+    LIMIT ?'''
+
+ALL_NOTES_SQL = '''
+    SELECT id, content
+    FROM notes
+    WHERE chat_id = ?
+    ORDER BY created_at DESC'''
+
+NOTES_BY_CATEGORY_SQL = '''
+    SELECT n.id, n.content
+    FROM notes n
+    JOIN note_category nc ON n.id = nc.note_id
+    JOIN categories c ON nc.category_id = c.id
+    WHERE n.chat_id = ? AND c.name = ?
+    ORDER BY n.created_at DESC'''
+
+CHAT_CATEGORIES_SQL = '''
+    SELECT DISTINCT c.name
+    FROM categories c
+    JOIN note_category nc ON c.id = nc.category_id
+    JOIN notes n ON nc.note_id = n.id
+    WHERE n.chat_id = ?
+    ORDER BY c.name'''
+
+CLAIM_JOBS_SQL = '''
+    SELECT id, payload, attempts
+    FROM jobs
+    WHERE kind = ? AND (
+        (status = 'pending' AND run_after <= ?)
+        OR (status = 'running' AND COALESCE(claimed_at, 0) <= ?))
+    ORDER BY id
+    LIMIT ?'''
+
+HOT_QUERIES = {
+    'get_notes': (RECENT_NOTES_SQL, (0, 10)),
+    'get_all_notes': (ALL_NOTES_SQL, (0,)),
+    'get_notes_by_category': (NOTES_BY_CATEGORY_SQL, (0, '')),
+    'get_all_categories': (CHAT_CATEGORIES_SQL, (0,)),
+    'claim_jobs': (CLAIM_JOBS_SQL, ('', 0, 0, 1)),
+}
+
 class NoteDatabase:
-    def __init__(self, db_name='notes.db'):
+    """Async note storage on a small pool of long-lived SQLite connections.
+
+    Under WAL, readers don't block the writer, so there is one writer
+    connection owned by a single-thread executor and a fixed set of reader
+    connections served by a reader executor. Blocking SQLite calls never run
+    on the event loop thread.
+
+    Writes are queued and committed in groups: a background task drains up to
+    max_write_batch pending writes (waiting at most max_write_delay seconds
+    for more to arrive) and runs them in one transaction, each under its own
+    savepoint so one failing write doesn't take the others down with it.
+    """
+
+    def __init__(self, db_name='notes.db', readers=4, max_write_batch=100, max_write_delay=0.02):
         self.db_name = db_name
-        self._create_table()
-        
-    @contextmanager
-    def _get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_name)
+        self.max_write_batch = max_write_batch
+        self.max_write_delay = max_write_delay
+        self._write_queue = None  # Created with the drain task on the first write
+        self._write_task = None
+        self._writer = self._connect()
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        # Runs before the event loop starts, so it uses the writer directly
+        self._migrate()
+        # Category name -> id. Categories are never deleted, so entries stay
+        # valid; warmed here and written through after each committed insert
+        self._category_ids = dict(self._writer.execute('SELECT name, id FROM categories'))
+
+    def _connect(self):
+        """Open a connection and apply per-connection pragmas once"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
         conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe under WAL, avoids an fsync per commit
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _run_read(self, operation):
+        """Run operation(conn) on a pooled reader connection"""
+        conn = self._readers.get()
+        try:
+            return operation(conn)
+        finally:
+            self._readers.put(conn)
+
+    def _run_write_batch(self, operations):
+        """Run operations in one transaction; returns (ok, result or exception) per operation"""
+        conn = self._writer
+        results = []
+        # Take the write lock up front: other processes sharing notes.db then wait on
+        # busy_timeout instead of failing with SQLITE_BUSY on a lock upgrade
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            yield conn
+            for operation in operations:
+                conn.execute("SAVEPOINT write_item")
+                try:
+                    results.append((True, operation(conn)))
+                    conn.execute("RELEASE write_item")
+                except Exception as e:
+                    logger.error(f"Database error: {e}")
+                    conn.execute("ROLLBACK TO write_item")
+                    conn.execute("RELEASE write_item")
+                    results.append((False, e))
             conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Database error: {e}")
+        except sqlite3.Error:
             conn.rollback()
             raise
-        finally:
-            conn.close()
-
-    def _create_table(self):
-        """Create notes and categories tables if they don't exist"""
-        with self._get_connection() as conn:
-            # Create notes table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS notes
-                (id INTEGER PRIMARY KEY, 
-                 chat_id INTEGER, 
-                 content TEXT,
-                 created_at DATETIME)
-            ''')
-            
-            # Create categories table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS categories
-                (id INTEGER PRIMARY KEY,
-                 name TEXT UNIQUE)
-            ''')
-            
-            # Create note_category join table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS note_category
-                (note_id INTEGER,
-                 category_id INTEGER,
-                 PRIMARY KEY (note_id, category_id),
-                 FOREIGN KEY (note_id) REFERENCES notes(id),
-                 FOREIGN KEY (category_id) REFERENCES categories(id))
-            ''')
-
-    async def add_note(self, chat_id, content):
-        """Add a new note with automatic retry on failure"""
-        max_retries = 3
-        for attempt in range(max_retries):
+        return results
+
+    async def _write(self, operation):
+        """Queue operation(conn) for the next group commit and wait for its result"""
+        if self._write_task is None:
+            self._write_queue = asyncio.Queue()
+            self._write_task = asyncio.create_task(self._drain_writes())
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((operation, future))
+        return await future
+
+    async def _drain_writes(self):
+        """Commit queued writes in batches bounded by count and delay"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._write_queue.get()]
+            deadline = loop.time() + self.max_write_delay
+            while len(batch) < self.max_write_batch:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._write_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
             try:
-                with self._get_connection() as conn:
-                    conn.execute(
-                        'INSERT INTO notes (chat_id, content, created_at) VALUES (?, ?, ?)',
-                        (chat_id, content.strip(), datetime.now())
-                    )
-                    return True
+                results = await loop.run_in_executor(
+                    self._write_executor, self._run_write_batch, [operation for operation, _ in batch]
+                )
+            except Exception as e:
+                # The commit itself failed, so none of the batch was written
+                results = [(False, e)] * len(batch)
+
+            for (_, future), (ok, value) in zip(batch, results):
+                if not future.done():
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                self._write_queue.task_done()
+
+    async def _read(self, operation):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, operation)
+
+    async def close(self):
+        """Flush queued writes, then stop the executors and close every pooled connection"""
+        if self._write_task is not None:
+            await self._write_queue.join()
+            self._write_task.cancel()
+            self._write_task = None
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._writer.close()
+        while not self._readers.empty():
+            self._readers.get().close()
+
+    def _migrate(self):
+        """Bring the schema up to date, recording progress in PRAGMA user_version"""
+        conn = self._writer
+        while True:
+            # Each migration and its version bump commit together, or not at all. The
+            # version is read under the write lock so concurrent processes can't both apply it.
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return
+            target = version + 1
+            try:
+                for statement in MIGRATIONS[version]:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.commit()
             except sqlite3.Error as e:
-                logger.warning(f"Failed to add note (attempt {attempt + 1}): {e}")
-                if attempt == max_retries - 1:
-                    raise
-        return False
+                logger.error(f"Migration {target} failed: {e}")
+                conn.rollback()
+                raise
+            logger.info(f"Applied database migration {target}")
+
+    async def add_note(self, chat_id, content, categorize=False):
+        """Add a new note; returns the new note id.
+
+        With categorize, a categorization job is queued in the same transaction,
+        so the note can't be saved without it.
+        """
+        def insert(conn):
+            cursor = conn.execute(
+                'INSERT INTO notes (chat_id, content, created_at) VALUES (?, ?, ?)',
+                (chat_id, content.strip(), datetime.now())
+            )
+            if categorize:
+                self._enqueue_job(conn, 'categorize', {'note_id': cursor.lastrowid})
+            return cursor.lastrowid
+
+        # Writes are serialized through the write queue, so there is no lock contention to retry
+        return await self._write(insert)
 
     async def get_notes(self, chat_id, limit=10):
-        """Get notes with connection pooling and error handling"""
+        """Get a chat's most recent notes"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.execute(
-                    '''SELECT content, created_at 
-                       FROM notes 
-                       WHERE chat_id = ? 
-                       ORDER BY created_at DESC 
-                       LIMIT ?''',
-                    (chat_id, limit)
-                )
-                return cursor.fetchall()
+            return await self._read(lambda conn: conn.execute(
+                RECENT_NOTES_SQL, (chat_id, limit)
+            ).fetchall())
         except sqlite3.Error as e:
             logger.error(f"Error getting notes: {e}")
             return []
 
-    def verify_connection(self):
-        """Verify database connection is working"""
+    async def get_notes_by_ids(self, note_ids):
+        """Get (id, content) for the given notes that still exist"""
+        placeholders = ','.join('?' * len(note_ids))
+        return await self._read(lambda conn: conn.execute(
+            f'SELECT id, content FROM notes WHERE id IN ({placeholders})', list(note_ids)
+        ).fetchall())
+
+    async def verify_connection(self):
+        """Verify the database answers reads and writes.
+
+        The read touches a real table, so a missing, locked or corrupt file fails
+        it (SELECT 1 alone never reads the file). The no-op write goes through the
+        group-commit queue and takes the write lock, so a stuck writer fails it too.
+        """
         try:
-            with self._get_connection() as conn:
-                conn.execute("SELECT 1")
+            await self._read(lambda conn: conn.execute("SELECT 1 FROM notes LIMIT 1").fetchall())
+            await self._write(lambda conn: conn.execute("SELECT 1 FROM jobs LIMIT 1").fetchall())
             return True
         except sqlite3.Error:
             return False
@@ -100,105 +320,123 @@ class NoteDatabase:
     async def get_all_notes(self, chat_id):
         """Get all notes for a chat"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.execute(
-                    '''SELECT id, content 
-                       FROM notes 
-                       WHERE chat_id = ? 
-                       ORDER BY created_at DESC''',
-                    (chat_id,)
-                )
-                return cursor.fetchall()
+            return await self._read(lambda conn: conn.execute(
+                ALL_NOTES_SQL, (chat_id,)
+            ).fetchall())
         except sqlite3.Error as e:
             logger.error(f"Error getting all notes: {e}")
             return []
 
     async def delete_note(self, note_id):
         """Delete a note by ID"""
+        return bool(await self.delete_notes([note_id]))
+
+    async def delete_notes(self, note_ids):
+        """Delete notes with their category links and embeddings in one transaction; returns the ids deleted"""
+        params = [(note_id,) for note_id in note_ids]
+        placeholders = ','.join('?' * len(note_ids))
+
+        def delete(conn):
+            conn.executemany('DELETE FROM note_category WHERE note_id = ?', params)
+            conn.executemany('DELETE FROM note_embeddings WHERE note_id = ?', params)
+            rows = conn.execute(f'DELETE FROM notes WHERE id IN ({placeholders}) RETURNING id', list(note_ids))
+            return [note_id for note_id, in rows.fetchall()]
+
         try:
-            with self._get_connection() as conn:
-                conn.execute(
-                    'DELETE FROM notes WHERE id = ?',
-                    (note_id,)
-                )
-                return True
+            return await self._write(delete)
         except sqlite3.Error as e:
-            logger.error(f"Error deleting note: {e}")
-            return False
+            logger.error(f"Error deleting notes: {e}")
+            return []
 
     async def update_note(self, note_id, new_content):
         """Update a note's content"""
+        return bool(await self.update_notes([note_id], new_content))
+
+    async def update_notes(self, note_ids, new_content):
+        """Set the content of several notes in one transaction; returns the ids updated"""
+        content = new_content.strip()
+        placeholders = ','.join('?' * len(note_ids))
+
+        def update(conn):
+            # The stored embeddings no longer match the content
+            conn.executemany('DELETE FROM note_embeddings WHERE note_id = ?', [(note_id,) for note_id in note_ids])
+            rows = conn.execute(
+                f'UPDATE notes SET content = ? WHERE id IN ({placeholders}) RETURNING id',
+                [content, *note_ids]
+            )
+            return [note_id for note_id, in rows.fetchall()]
+
         try:
-            with self._get_connection() as conn:
-                conn.execute(
-                    'UPDATE notes SET content = ? WHERE id = ?',
-                    (new_content.strip(), note_id)
-                )
-                return True
+            return await self._write(update)
         except sqlite3.Error as e:
-            logger.error(f"Error updating note: {e}")
-            return False
+            logger.error(f"Error updating notes: {e}")
+            return []
+
+    def _resolve_categories(self, conn, names):
+        """Map category names to ids within the caller's transaction, inserting missing ones.
+
+        Cached names cost nothing; the rest take one bulk INSERT OR IGNORE and
+        one SELECT. The cache is only updated by the caller once the write has
+        committed, so a rolled-back insert never leaves a stale id behind.
+        """
+        ids = {name: self._category_ids[name] for name in names if name in self._category_ids}
+        missing = [name for name in names if name not in ids]
+        if missing:
+            conn.executemany('INSERT OR IGNORE INTO categories (name) VALUES (?)', [(name,) for name in missing])
+            placeholders = ','.join('?' * len(missing))
+            ids.update(conn.execute(
+                f'SELECT name, id FROM categories WHERE name IN ({placeholders})', missing
+            ))
+        return ids
 
     async def get_or_create_category(self, name):
         """Get or create a category by name"""
+        name = name.lower()
+        if name in self._category_ids:
+            return self._category_ids[name]
         try:
-            with self._get_connection() as conn:
-                # Try to get existing category
-                cursor = conn.execute(
-                    'SELECT id FROM categories WHERE name = ?',
-                    (name.lower(),)
-                )
-                result = cursor.fetchone()
-                
-                if result:
-                    return result[0]
-                
-                # Create new category
-                cursor = conn.execute(
-                    'INSERT INTO categories (name) VALUES (?)',
-                    (name.lower(),)
-                )
-                return cursor.lastrowid
+            ids = await self._write(lambda conn: self._resolve_categories(conn, [name]))
         except sqlite3.Error as e:
             logger.error(f"Error getting/creating category: {e}")
             return None
+        self._category_ids.update(ids)
+        return ids.get(name)
 
     async def categorize_note(self, note_id, category_names):
-        """Categorize a note with given categories"""
-        try:
-            with self._get_connection() as conn:
-                # Remove existing categories for this note
-                conn.execute(
-                    'DELETE FROM note_category WHERE note_id = ?',
-                    (note_id,)
-                )
-                
-                # Add new categories
-                for category_name in category_names:
-                    category_id = await self.get_or_create_category(category_name)
-                    if category_id:
-                        conn.execute(
-                            'INSERT INTO note_category (note_id, category_id) VALUES (?, ?)',
-                            (note_id, category_id)
-                        )
-                return True
-        except sqlite3.Error as e:
-            logger.error(f"Error categorizing note: {e}")
-            return False
+        """Categorize a note with given categories.
+
+        Raises sqlite3.Error on failure, so the categorization job can record it and retry.
+        """
+        names = list(dict.fromkeys(name.lower() for name in category_names))
+
+        def categorize(conn):
+            # The note may have been deleted while waiting to be categorized
+            if conn.execute('SELECT 1 FROM notes WHERE id = ?', (note_id,)).fetchone() is None:
+                return {}
+
+            # Remove existing categories for this note
+            conn.execute(
+                'DELETE FROM note_category WHERE note_id = ?',
+                (note_id,)
+            )
+
+            # Add new categories, resolved in the same transaction
+            ids = self._resolve_categories(conn, names)
+            conn.executemany(
+                'INSERT OR IGNORE INTO note_category (note_id, category_id) VALUES (?, ?)',
+                [(note_id, category_id) for category_id in ids.values()]
+            )
+            return ids
+
+        ids = await self._write(categorize)
+        self._category_ids.update(ids)
 
     async def get_notes_by_category(self, chat_id, category_name):
         """Get notes belonging to a specific category"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.execute('''
-                    SELECT n.id, n.content 
-                    FROM notes n
-                    JOIN note_category nc ON n.id = nc.note_id
-                    JOIN categories c ON nc.category_id = c.id
-                    WHERE n.chat_id = ? AND c.name = ?
-                    ORDER BY n.created_at DESC
-                ''', (chat_id, category_name.lower()))
-                return cursor.fetchall()
+            return await self._read(lambda conn: conn.execute(
+                NOTES_BY_CATEGORY_SQL, (chat_id, category_name.lower())
+            ).fetchall())
         except sqlite3.Error as e:
             logger.error(f"Error getting notes by category: {e}")
             return []
@@ -206,16 +444,132 @@ class NoteDatabase:
     async def get_all_categories(self, chat_id):
         """Get all categories used by a chat"""
         try:
-            with self._get_connection() as conn:
-                cursor = conn.execute('''
-                    SELECT DISTINCT c.name 
-                    FROM categories c
-                    JOIN note_category nc ON c.id = nc.category_id
-                    JOIN notes n ON nc.note_id = n.id
-                    WHERE n.chat_id = ?
-                    ORDER BY c.name
-                ''', (chat_id,))
-                return [row[0] for row in cursor.fetchall()]
+            rows = await self._read(lambda conn: conn.execute(
+                CHAT_CATEGORIES_SQL, (chat_id,)
+            ).fetchall())
+            return [row[0] for row in rows]
         except sqlite3.Error as e:
             logger.error(f"Error getting categories: {e}")
             return []
+
+    async def save_note_embedding(self, note_id, embedding_blob):
+        """Store (or replace) the embedding of a note"""
+        try:
+            await self._write(lambda conn: conn.execute(
+                'INSERT OR REPLACE INTO note_embeddings (note_id, embedding) VALUES (?, ?)',
+                (note_id, embedding_blob)
+            ))
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error saving note embedding: {e}")
+            return False
+
+    async def get_all_note_embeddings(self):
+        """Get (chat_id, note_id, embedding) for every embedded note"""
+        try:
+            return await self._read(lambda conn: conn.execute('''
+                SELECT n.chat_id, e.note_id, e.embedding
+                FROM note_embeddings e
+                JOIN notes n ON n.id = e.note_id
+            ''').fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Error getting note embeddings: {e}")
+            return []
+
+    async def get_notes_without_embeddings(self):
+        """Get (chat_id, id, content) for notes that haven't been embedded yet"""
+        try:
+            return await self._read(lambda conn: conn.execute('''
+                SELECT n.chat_id, n.id, n.content
+                FROM notes n
+                LEFT JOIN note_embeddings e ON e.note_id = n.id
+                WHERE e.note_id IS NULL
+            ''').fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Error getting unembedded notes: {e}")
+            return []
+
+    @staticmethod
+    def _enqueue_job(conn, kind, payload):
+        conn.execute(
+            'INSERT INTO jobs (kind, payload) VALUES (?, ?)',
+            (kind, json.dumps(payload))
+        )
+
+    async def enqueue_job(self, kind, payload):
+        """Queue a background job with a JSON-serializable payload"""
+        await self._write(lambda conn: self._enqueue_job(conn, kind, payload))
+
+    async def claim_jobs(self, kind, limit, lease):
+        """Mark up to limit due jobs of a kind as running; returns [(id, payload, attempts)].
+
+        Claims go through the single writer, so concurrent workers never get the same job.
+        A claim is a lease of lease seconds: running jobs whose lease has expired, e.g.
+        because the process that claimed them died, are claimed again.
+        """
+        def claim(conn):
+            now = time.time()
+            rows = conn.execute(CLAIM_JOBS_SQL, (kind, now, now - lease, limit)).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, claimed_at = ? WHERE id = ?",
+                [(now, job_id) for job_id, _, _ in rows]
+            )
+            return [(job_id, json.loads(payload), attempts + 1) for job_id, payload, attempts in rows]
+
+        return await self._write(claim)
+
+    async def complete_jobs(self, job_ids):
+        await self._write(lambda conn: conn.executemany(
+            'DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in job_ids]
+        ))
+
+    async def fail_jobs(self, job_ids, error, max_attempts, retry_delay):
+        """Retry failed jobs after an exponential delay, or dead-letter them after max_attempts"""
+        now = time.time()
+
+        def fail(conn):
+            conn.executemany('''
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                    run_after = ? + ? * (1 << (attempts - 1)),
+                    last_error = ?
+                WHERE id = ?''', [(max_attempts, now, retry_delay, str(error), job_id) for job_id in job_ids])
+
+        await self._write(fail)
+
+    async def get_chat_state(self, chat_id):
+        """Stored JSON state for a chat, or None"""
+        row = await self._read(lambda conn: conn.execute(
+            'SELECT state FROM chat_state WHERE chat_id = ?', (chat_id,)
+        ).fetchone())
+        return row[0] if row else None
+
+    async def save_chat_state(self, chat_id, state):
+        await self._write(lambda conn: conn.execute('''
+            INSERT INTO chat_state (chat_id, state, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at''',
+            (chat_id, state, time.time())
+        ))
+
+def check_query_plans(db_name='notes.db'):
+    """Return {query: plan} for hot queries whose plan full-scans a table; empty if all use indexes"""
+    conn = sqlite3.connect(db_name)
+    try:
+        problems = {}
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            if any(detail.startswith("SCAN") for detail in plan):
+                problems[name] = plan
+        return problems
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    # Migrate the database, then fail if any hot query has regressed to a full scan
+    import sys
+    db_name = sys.argv[1] if len(sys.argv) > 1 else 'notes.db'
+    NoteDatabase(db_name, readers=1)
+    problems = check_query_plans(db_name)
+    for name, plan in problems.items():
+        print(f"{name}: {'; '.join(plan)}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import logging
+from database import NoteDatabase
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "30"))
+FAILURE_THRESHOLD = 3      # Consecutive failed checks before the circuit opens
+MAX_RECONNECT_DELAY = 60
+PROBE_TIMEOUT = 10         # A probe that hangs this long counts as failed
+CLOSE_GRACE = 30           # Seconds a replaced database stays open for handlers still using it
+
+class DatabaseHealth:
+    """Background health monitoring and reconnection for bot_data['db'].
+
+    A task probes the database every CHECK_INTERVAL seconds and caches the
+    result, so the message path only reads the available flag. After
+    FAILURE_THRESHOLD failed probes the circuit opens: messages are refused
+    while the task rebuilds the NoteDatabase with exponential backoff, and
+    the circuit closes again once the new one answers. The old database is
+    only closed CLOSE_GRACE seconds after the swap, since handlers that read
+    bot_data['db'] earlier may still be using it.
+    """
+
+    def __init__(self, bot_data, db_name='notes.db', interval=CHECK_INTERVAL):
+        self.bot_data = bot_data
+        self.db_name = db_name
+        self.interval = interval
+        self.available = True
+        self.failures = 0
+        self._task = None
+        self._retiring = set()  # Tasks closing replaced databases
+
+    def start(self):
+        self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Nothing may end this loop, or the circuit would never open or close again
+            try:
+                if await self._probe(self.bot_data['db']):
+                    self.failures = 0
+                    continue
+
+                self.failures += 1
+                logger.warning(f"Database health check failed ({self.failures}/{FAILURE_THRESHOLD})")
+                if self.failures >= FAILURE_THRESHOLD:
+                    self.available = False
+                    await self._reconnect()
+            except Exception as e:
+                logger.error(f"Database health monitor error: {e}")
+
+    async def _probe(self, db):
+        try:
+            return await asyncio.wait_for(db.verify_connection(), timeout=PROBE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Database health check error: {e!r}")
+            return False
+
+    async def _reconnect(self):
+        """Rebuild the database with exponential backoff until it answers"""
+        delay = 1
+        while True:
+            logger.error("Database unavailable, reconnecting")
+            try:
+                # Connecting and migrating block, so keep them off the event loop
+                db = await asyncio.get_running_loop().run_in_executor(None, NoteDatabase, self.db_name)
+                if await self._probe(db):
+                    # Swap first; the old one is closed once its users are done
+                    self._retire(self.bot_data['db'])
+                    self.bot_data['db'] = db
+                    self.available = True
+                    self.failures = 0
+                    logger.info("Database reconnected")
+                    return
+                self._retire(db, grace=0)
+            except Exception as e:
+                logger.error(f"Error reconnecting to database: {e}")
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _retire(self, db, grace=CLOSE_GRACE):
+        """Close db in the background after grace seconds"""
+        async def close():
+            await asyncio.sleep(grace)
+            try:
+                await asyncio.wait_for(db.close(), timeout=5)
+            except Exception as e:
+                logger.error(f"Error closing database: {e}")
+
+        task = asyncio.create_task(close())
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
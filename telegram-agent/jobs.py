@@ -0,0 +1,121 @@
+import asyncio
+import os
+import logging
+from llm_handler import categorize_notes
+
+logger = logging.getLogger(__name__)
+
+CATEGORIZE_BATCH = 10   # Notes per categorization prompt
+MAX_ATTEMPTS = 5        # Then the job is dead-lettered
+RETRY_DELAY = 5         # Seconds before the first retry, doubling per attempt
+JOB_LEASE = 300         # Seconds a claimed job may run before another worker may claim it again
+POLL_INTERVAL = 10      # Seconds between checks for due retries when not notified
+
+class CategorizationWorker:
+    """Worker tasks draining the 'categorize' jobs in notes.db.
+
+    Jobs are queued in the same transaction as their note, so they survive
+    restarts. Each worker claims up to CATEGORIZE_BATCH due jobs and
+    categorizes all their notes with one prompt. A claim is a JOB_LEASE-second
+    lease, so jobs held by a process that died are picked up again by any
+    worker once it expires. Failed jobs are retried with exponential backoff
+    and marked dead after MAX_ATTEMPTS; dead jobs stay in the jobs table for
+    inspection.
+    """
+
+    def __init__(self, bot_data, workers=int(os.getenv("CATEGORIZE_WORKERS", "2"))):
+        self.bot_data = bot_data
+        self.workers = workers
+        self._wakeup = None
+        self._tasks = []
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()  # Pick up anything queued before this start
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake a worker for newly queued jobs"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            # Drain due jobs batch by batch, then wait for more
+            try:
+                while await self._run_batch():
+                    pass
+            except Exception as e:
+                logger.error(f"Categorization worker error: {e}")
+
+    async def _run_batch(self):
+        """Claim and process one batch; returns False when nothing was due"""
+        db = self.bot_data['db']
+        jobs = await db.claim_jobs('categorize', CATEGORIZE_BATCH, JOB_LEASE)
+        if not jobs:
+            return False
+
+        settled = set()  # Job ids already completed or failed
+        try:
+            await self._process(db, jobs, settled)
+        except Exception as e:
+            # Claimed jobs must not stay 'running': send the rest back for a retry
+            logger.error(f"Error processing categorization jobs: {e}")
+            unsettled = [job_id for job_id, _, _ in jobs if job_id not in settled]
+            if unsettled:
+                await db.fail_jobs(unsettled, e, MAX_ATTEMPTS, RETRY_DELAY)
+        return True
+
+    async def _process(self, db, jobs, settled):
+        # A note can be queued more than once, e.g. by a reclaim after a crash
+        jobs_by_note = {}
+        for job_id, job, _ in jobs:
+            jobs_by_note.setdefault(job['note_id'], []).append(job_id)
+        attempts = {job_id: attempts for job_id, _, attempts in jobs}
+
+        notes = await db.get_notes_by_ids(list(jobs_by_note))
+        existing = {note_id for note_id, _ in notes}
+        # Notes deleted in the meantime need no categories
+        done = [job_id for note_id, job_ids in jobs_by_note.items() if note_id not in existing for job_id in job_ids]
+        failures = {}  # error message -> job ids
+
+        if notes:
+            try:
+                categories = await categorize_notes(self.bot_data['llm'].for_chat(None), notes)
+                missing_error = "No categories returned"
+            except Exception as e:
+                logger.error(f"Error categorizing notes: {e}")
+                categories, missing_error = {}, f"Categorization request failed: {e}"
+
+            for note_id, _ in notes:
+                if note_id not in categories:
+                    failures.setdefault(missing_error, []).extend(jobs_by_note[note_id])
+                    continue
+                try:
+                    await db.categorize_note(note_id, categories[note_id])
+                    done.extend(jobs_by_note[note_id])
+                except Exception as e:
+                    logger.error(f"Error saving categories for note {note_id}: {e}")
+                    failures.setdefault(f"Saving categories failed: {e}", []).extend(jobs_by_note[note_id])
+
+        if done:
+            await db.complete_jobs(done)
+            settled.update(done)
+        for error, job_ids in failures.items():
+            await db.fail_jobs(job_ids, error, MAX_ATTEMPTS, RETRY_DELAY)
+            settled.update(job_ids)
+            dead = [job_id for job_id in job_ids if attempts[job_id] >= MAX_ATTEMPTS]
+            if dead:
+                logger.error(f"Dead-lettered categorization jobs {dead}: {error}")
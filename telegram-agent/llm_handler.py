@@ -1,10 +1,32 @@
 import asyncio
+import functools
+import json
+import os
 import re
+import sys
 import logging
-from database import NoteDatabase
+import weakref
+from telegram.error import BadRequest, RetryAfter
+from scheduler import Superseded
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
+from llm_common.note_index import to_blob, from_blob
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-002"  # Same model as the rag server; verify with Deepseek docs
+
+# Notes at least this similar to a topic count as related. With ada-style embedding
+# models even unrelated short texts score around 0.7, so 0.6 matched nearly every
+# note; 0.8 keeps roughly topical matches. Re-tune if the embedding model changes.
+RELATED_NOTES_THRESHOLD = float(os.getenv("NOTE_SIMILARITY_THRESHOLD", "0.8"))
+RELATED_NOTES_LIMIT = 20  # Every match is listed in the confirmation
+
+# Replies are streamed into a message that is edited as tokens arrive
+STREAM_REPLIES = os.getenv("TELEGRAM_STREAM_REPLIES", "1") != "0"
+MESSAGE_LIMIT = 4000  # Below Telegram's 4096-character cap
+EDIT_INTERVAL = 1.0   # Seconds between edits, to stay under Telegram's per-chat rate limit
+
 SYSTEM_MESSAGE = {
     "role": "system",
     "content": """You are a helpful AI assistant. Your tasks include:
@@ -27,17 +49,11 @@ async def handle_message(update, context):
     chat_id = update.effective_chat.id
     user_input = update.message.text
 
-    if 'conversation' not in context.chat_data:
-        context.chat_data['conversation'] = [context.bot_data['system_message']]
-
-    # Database connection check
+    # Cached by the background health monitor, which also handles reconnecting
+    if not context.bot_data['db_health'].available:
+        await update.message.reply_text("⚠️ Database connection issue, reconnecting - please try again shortly")
+        return
     db = context.bot_data['db']
-    if not db.verify_connection():
-        await update.message.reply_text("⚠️ Database connection issue, trying to reconnect...")
-        context.bot_data['db'] = NoteDatabase()
-        if not db.verify_connection():
-            await update.message.reply_text("❌ Failed to reconnect to database")
-            return
 
     # Try to interpret as command first
     command_executed = await context.bot_data['interpreter'](user_input, update, context)
@@ -49,85 +65,255 @@ async def handle_message(update, context):
         note_text = re.sub(r'\b(remember|note:?)\b', '', user_input, flags=re.IGNORECASE).strip()
         if note_text:
             try:
-                # Save note and get its ID
-                note_id = await db.add_note(chat_id, note_text)
+                # Save note with a queued categorization job; the worker categorizes it off the reply path
+                note_id = await db.add_note(chat_id, note_text, categorize=True)
                 if note_id:
-                    # Automatically categorize the note
-                    categories = await categorize_note(context.bot_data['client'], note_text)
-                    if categories:
-                        await db.categorize_note(note_id, categories)
-                        await update.message.reply_text(f"📝 I've saved this note under categories: {', '.join(categories)}")
-                    else:
-                        await update.message.reply_text("📝 I've saved this note but couldn't determine categories")
+                    context.bot_data['categorizer'].notify()
+                    # Embedding waits its turn in the scheduler; don't hold the reply for it
+                    run_in_background(context.bot_data, index_note(context.bot_data, chat_id, [note_id], note_text))
+                    await update.message.reply_text("📝 I've saved this note, categories will follow shortly")
                 else:
                     await update.message.reply_text("⚠️ Failed to save note automatically")
             except Exception as e:
                 logger.error(f"Error auto-saving note: {e}")
                 await update.message.reply_text("🚨 Error saving note automatically")
 
-    context.chat_data['conversation'].append({"role": "user", "content": user_input})
+    # Loaded after routing, since a routed /start or /reset replaces the conversation
+    store = context.bot_data['chat_store']
+    state = await store.get(chat_id)
+    conversation = state.conversation
+    conversation.append("user", user_input)
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        client = context.bot_data['client']
-        completion = await client.chat.completions.create(
-            model="deepseek-chat",
-            messages=context.chat_data['conversation']
-        )
-        full_response = completion.choices[0].message.content
+        # A newer message from this chat replaces this reply if it is still queued
+        client = context.bot_data['llm'].for_chat(chat_id, supersede="reply")
+        if STREAM_REPLIES:
+            stream = await client.chat.completions.create(
+                model="deepseek-chat",
+                messages=conversation.messages(),
+                stream=True
+            )
+            full_response = await stream_reply(update, stream)
+        else:
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+            completion = await client.chat.completions.create(
+                model="deepseek-chat",
+                messages=conversation.messages()
+            )
+            full_response = completion.choices[0].message.content
 
-        response_parts = [full_response[i:i+4000] for i in range(0, len(full_response), 4000)]
-        for part in response_parts:
-            await update.message.reply_text(part)
-            await asyncio.sleep(0.5)
+            response_parts = [full_response[i:i+MESSAGE_LIMIT] for i in range(0, len(full_response), MESSAGE_LIMIT)]
+            for part in response_parts:
+                await update.message.reply_text(part)
+                await asyncio.sleep(0.5)
 
-        context.chat_data['conversation'].append({"role": "assistant", "content": full_response})
+        conversation.append("assistant", full_response)
+        # Older turns that no longer fit are summarized off the reply path
+        conversation.schedule_summary(context.bot_data['llm'].for_chat(chat_id))
+    except Superseded:
+        logger.info(f"Reply in chat {chat_id} superseded by a newer message")
     except Exception as e:
         logger.error(f"Error in handle_message: {e}")
         await update.message.reply_text("🚨 Error processing your request")
 
+    try:
+        await store.save(chat_id, state)
+    except Exception as e:
+        logger.error(f"Error saving chat state: {e}")
+
+async def _edit_message(message, text, wait=False):
+    """Edit a message's text; when rate limited, either wait and retry or give up (returns False)"""
+    while True:
+        try:
+            await message.edit_text(text)
+            return True
+        except RetryAfter as e:
+            if not wait:
+                return False
+            await asyncio.sleep(e.retry_after)
+        except BadRequest as e:
+            # Editing to identical text is harmless
+            if "not modified" in str(e).lower():
+                return True
+            raise
+
+async def stream_reply(update, stream):
+    """Show a streamed completion in a placeholder message edited as tokens arrive.
+
+    Edits are coalesced to one per EDIT_INTERVAL. Text past MESSAGE_LIMIT
+    finishes the current message and continues in a new one. Returns the full reply.
+    """
+    loop = asyncio.get_running_loop()
+    message = await update.message.reply_text("…")
+    full_response = ""
+    start = 0   # Offset in full_response where the current message begins
+    shown = ""  # Text the current message shows
+    last_edit = loop.time()
+
+    try:
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            full_response += chunk.choices[0].delta.content
+
+            # Finish the current message at the limit and roll over to a new one
+            while len(full_response) - start > MESSAGE_LIMIT:
+                finished = full_response[start:start + MESSAGE_LIMIT]
+                if finished != shown:
+                    await _edit_message(message, finished, wait=True)
+                start += MESSAGE_LIMIT
+                shown = full_response[start:start + MESSAGE_LIMIT]
+                message = await update.message.reply_text(shown)
+                last_edit = loop.time()
+
+            text = full_response[start:]
+            if text != shown and loop.time() - last_edit >= EDIT_INTERVAL:
+                if await _edit_message(message, text):
+                    shown = text
+                last_edit = loop.time()
+    finally:
+        await stream.close()
+
+    text = full_response[start:] or "⚠️ Empty response"
+    if text != shown:
+        await _edit_message(message, text, wait=True)
+    return full_response
+
+def chat_lock(bot_data, chat_id):
+    """Lock serializing one chat's updates; updates from different chats still run concurrently"""
+    locks = bot_data.setdefault('chat_locks', weakref.WeakValueDictionary())
+    lock = locks.get(chat_id)
+    if lock is None:
+        lock = locks[chat_id] = asyncio.Lock()
+    return lock
+
+def serialized(handler):
+    """Run handler under its chat's lock, so e.g. /reset can't interleave with a reply in progress"""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        async with chat_lock(context.bot_data, update.effective_chat.id):
+            await handler(update, context)
+    return wrapper
+
+async def handle_text(update, context):
+    """Route a text message to the pending confirmation, if any, or the normal message handler"""
+    chat_id = update.effective_chat.id
+    # A reply still waiting in the scheduler is stale now; drop it so this message's turn comes sooner
+    context.bot_data['llm'].cancel_pending(chat_id, "reply")
+    async with chat_lock(context.bot_data, chat_id):
+        state = await context.bot_data['chat_store'].get(chat_id)
+        if state.pending_command is not None:
+            await handle_confirmation(update, context)
+        else:
+            await handle_message(update, context)
+
 async def handle_confirmation(update, context):
     """Handle command confirmation responses"""
     chat_id = update.effective_chat.id
     user_input = update.message.text.lower()
+    store = context.bot_data['chat_store']
+    state = await store.get(chat_id)
     
-    if "pending_command" not in context.user_data:
+    if state.pending_command is None:
         await update.message.reply_text("No pending command to confirm")
         return
         
     if user_input in ["yes", "y"]:
-        command = context.user_data["pending_command"]
-        del context.user_data["pending_command"]
-        await context.bot_data['commands'][command[1:]](update, context)
+        # The command reads its arguments from pending_command, so clear it afterwards
+        command = state.pending_command
+        try:
+            await context.bot_data['commands'][command[0][1:]](update, context)
+        finally:
+            state.pending_command = None
+            await store.save(chat_id, state)
     else:
         await update.message.reply_text("Command cancelled")
-        del context.user_data["pending_command"]
+        state.pending_command = None
+        await store.save(chat_id, state)
 
-async def find_related_notes(client, topic, notes):
-    """Use LLM to find notes related to a specific topic"""
-    try:
-        note_list = "\n".join([f"- {content}" for _, content in notes])
-        prompt = f"""Analyze these notes and return ONLY the IDs of notes related to '{topic}':
-{note_list}
+async def embed_texts(client, texts):
+    """Embed texts in one request, in input order"""
+    response = await client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
-Return ONLY a comma-separated list of IDs, nothing else. If no notes are related, return 'none'."""
-        
-        completion = await client.chat.completions.create(
-            model="deepseek-chat",
-        return [int(id.strip()) for id in result.split(",")]
+async def index_note(bot_data, chat_id, note_ids, content):
+    """Embed note content and add it to the stored embeddings and the in-memory index.
+
+    note_ids may hold several notes sharing the same content (bulk edits), which
+    then share one embedding call.
+    """
+    try:
+        embedding = (await embed_texts(bot_data['llm'].for_chat(chat_id), [content]))[0]
+        for note_id in note_ids:
+            await bot_data['db'].save_note_embedding(note_id, to_blob(embedding))
+            bot_data['note_index'].add(chat_id, note_id, embedding)
     except Exception as e:
-        logger.error(f"Error finding related notes: {e}")
-        return []
+        logger.error(f"Error indexing note: {e}")
+
+def run_in_background(bot_data, coro):
+    """Run coro as a task kept in bot_data['background_tasks'] until it finishes; shutdown cancels them"""
+    tasks = bot_data.setdefault('background_tasks', set())
+    task = asyncio.create_task(coro)
+    tasks.add(task)
+
+    def done(task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task failed: {task.exception()}")
+
+    task.add_done_callback(done)
+    return task
+
+def owns_chat(bot_data, chat_id):
+    """Whether this process handles chat_id (always, unless it is one of several webhook workers)"""
+    shard = bot_data.get('shard')
+    return shard is None or chat_id % shard[1] == shard[0]
+
+async def load_note_index(bot_data):
+    """Fill the in-memory index from notes.db, embedding notes saved without one"""
+    db = bot_data['db']
+    note_index = bot_data['note_index']
+    client = bot_data['llm'].for_chat(None)  # Startup backfill shares one queue
+    for chat_id, note_id, blob in await db.get_all_note_embeddings():
+        if owns_chat(bot_data, chat_id):
+            note_index.add(chat_id, note_id, from_blob(blob))
+
+    missing = [note for note in await db.get_notes_without_embeddings() if owns_chat(bot_data, note[0])]
+    for i in range(0, len(missing), 64):
+        batch = missing[i:i + 64]
+        try:
+            embeddings = await embed_texts(client, [content for _, _, content in batch])
+        except Exception as e:
+            logger.error(f"Error embedding existing notes: {e}")
+            return
+        for (chat_id, note_id, _), embedding in zip(batch, embeddings):
+            await db.save_note_embedding(note_id, to_blob(embedding))
+            note_index.add(chat_id, note_id, embedding)
+    logger.info(f"Loaded {len(note_index)} note embeddings")
+
+async def find_related_notes(bot_data, chat_id, topic):
+    """Find IDs of a chat's notes related to a topic with a local vector search.
 
-async def categorize_note(client, note_content):
-    """Use LLM to generate categories for a note"""
+    Falls back to asking the LLM over the chat's notes if the topic can't be embedded.
+    """
+    client = bot_data['llm'].for_chat(chat_id)
     try:
-        prompt = f"""Analyze this note and suggest 1-3 relevant categories. 
-Return ONLY a comma-separated list of category names, nothing else.
+        topic_embedding = (await embed_texts(client, [topic]))[0]
+        matches = bot_data['note_index'].search(
+            chat_id, topic_embedding, k=RELATED_NOTES_LIMIT, threshold=RELATED_NOTES_THRESHOLD
+        )
+        return [note_id for note_id, _ in matches]
+    except Exception as e:
+        logger.warning(f"Semantic note search failed, asking the LLM instead: {e}")
 
-Note content:
-{note_content}
+    try:
+        notes = await bot_data['db'].get_all_notes(chat_id)
+        if not notes:
+            return []
+        note_list = "\n".join([f"- {note_id}: {content}" for note_id, content in notes])
+        prompt = f"""Analyze these notes and return ONLY the IDs of notes related to '{topic}':
+{note_list}
 
-Categories:"""
+Return ONLY a comma-separated list of IDs, nothing else. If no notes are related, return 'none'."""
         
         completion = await client.chat.completions.create(
             model="deepseek-chat",
@@ -136,7 +322,42 @@ Categories:"""
         )
         
         result = completion.choices[0].message.content.strip()
-        return [cat.strip().lower() for cat in result.split(",")]
+        if result.lower() == 'none':
+            return []
+        valid_ids = {note_id for note_id, _ in notes}
+        return [int(id.strip()) for id in result.split(",") if int(id.strip()) in valid_ids]
     except Exception as e:
-        logger.error(f"Error categorizing note: {e}")
+        logger.error(f"Error finding related notes: {e}")
         return []
+
+async def categorize_notes(client, notes):
+    """Use LLM to generate categories for several notes in one prompt.
+
+    notes is [(note_id, content)]; returns {note_id: [category, ...]} for the
+    notes the model answered. Raises on request or parse errors so the job can be retried.
+    """
+    note_list = "\n".join(f"- {note_id}: {content}" for note_id, content in notes)
+    prompt = f"""Analyze these notes and suggest 1-3 relevant categories for each.
+Respond ONLY with a JSON object mapping each note ID to a list of category names.
+Example: {{"12": ["shopping", "errands"]}}
+
+Notes:
+{note_list}"""
+
+    completion = await client.chat.completions.create(
+        model="deepseek-chat",
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
+        temperature=0.2
+    )
+
+    result = json.loads(completion.choices[0].message.content)
+    valid_ids = {note_id for note_id, _ in notes}
+    categories = {}
+    for note_id, names in result.items():
+        if isinstance(names, str):
+            names = names.split(",")
+        names = [str(name).strip().lower() for name in names if str(name).strip()]
+        if note_id.isdigit() and int(note_id) in valid_ids and names:
+            categories[int(note_id)] = names
+    return categories
@@ -1,12 +1,21 @@
+import asyncio
 import os
+import sys
 import logging
 from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from openai import AsyncOpenAI
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))  # Shared llm_common package
 from database import NoteDatabase
 from commands import start, reset, help, save_note, show_notes, remove_notes, execute_remove_notes, edit_notes, execute_edit_notes
 from interpreter import interpret_command
-from llm_handler import handle_message, handle_confirmation, SYSTEM_MESSAGE
+from llm_handler import handle_text, serialized, load_note_index, run_in_background, SYSTEM_MESSAGE
+from llm_common.note_index import NoteVectorIndex
+from scheduler import LLMScheduler
+from health import DatabaseHealth
+from jobs import CategorizationWorker
+from chat_store import ChatStore
 
 # Configure logging
 logging.basicConfig(
@@ -15,10 +24,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main():
-    # Load environment variables
-    load_dotenv()
+async def post_init(application):
+    """Start background workers and load note embeddings once the event loop is running"""
+    application.bot_data['db_health'].start()
+    application.bot_data['chat_store'].start()
+    await application.bot_data['categorizer'].start()
+    # Backfilling unembedded notes goes through the rate-limited scheduler, so don't
+    # hold up startup for it; related-note searches see notes as they get loaded
+    run_in_background(application.bot_data, load_note_index(application.bot_data))
 
+async def shutdown(application):
+    """Stop background tasks and close the pooled database connections"""
+    await application.bot_data['db_health'].stop()
+    await application.bot_data['chat_store'].stop()
+    await application.bot_data['categorizer'].stop()
+    # Notes left unembedded are picked up by the next startup's backfill
+    tasks = application.bot_data.get('background_tasks', set())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await application.bot_data['llm'].close()
+    await application.bot_data['db'].close()
+
+def build_application(shard=None):
+    """Create the bot application and its shared services.
+
+    shard is (index, count) for a webhook worker process, which only handles
+    chats with chat_id % count == index and is fed updates by the receiver.
+    """
     # Initialize services
     db = NoteDatabase()
     client = AsyncOpenAI(
@@ -26,13 +59,30 @@ def main():
         base_url="https://api.deepseek.com"
     )
 
-    # Create application
-    application = Application.builder().token(os.getenv("TELEGRAM_TOKEN")).build()
+    # Create application; background tasks start once the event loop is running.
+    # Updates are handled concurrently across chats but one at a time within a chat
+    # (see serialized / handle_text); the LLM scheduler keeps that fair across chats.
+    builder = (
+        Application.builder()
+        .token(os.getenv("TELEGRAM_TOKEN"))
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(shutdown)
+    )
+    if shard is not None:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Store shared resources in bot_data
+    application.bot_data['shard'] = shard
     application.bot_data['db'] = db
-    application.bot_data['client'] = client
+    application.bot_data['db_health'] = DatabaseHealth(application.bot_data)
+    application.bot_data['llm'] = LLMScheduler(client)
+    application.bot_data['categorizer'] = CategorizationWorker(application.bot_data)
+    # Conversations and pending confirmations, persisted in notes.db
+    application.bot_data['chat_store'] = ChatStore(application.bot_data)
     application.bot_data['system_message'] = SYSTEM_MESSAGE
+    application.bot_data['note_index'] = NoteVectorIndex()
     application.bot_data['commands'] = {
         'start': start,
         'reset': reset,
@@ -44,27 +94,33 @@ def main():
     }
     application.bot_data['interpreter'] = interpret_command
 
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("reset", reset))
-    application.add_handler(CommandHandler("help", help))
-    application.add_handler(CommandHandler("save", save_note))
-    application.add_handler(CommandHandler("notes", show_notes))
-    application.add_handler(CommandHandler("remove_notes", remove_notes))
-    application.add_handler(CommandHandler("edit_notes", edit_notes))
+    # Add command handlers; bot_data['commands'] stays unwrapped since confirmations
+    # and the interpreter call those while already holding the chat's lock
+    application.add_handler(CommandHandler("start", serialized(start)))
+    application.add_handler(CommandHandler("reset", serialized(reset)))
+    application.add_handler(CommandHandler("help", serialized(help)))
+    application.add_handler(CommandHandler("save", serialized(save_note)))
+    application.add_handler(CommandHandler("notes", serialized(show_notes)))
+    application.add_handler(CommandHandler("remove_notes", serialized(remove_notes)))
+    application.add_handler(CommandHandler("edit_notes", serialized(edit_notes)))
     
     # Add message handler
-    application.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND,
-        lambda update, context: (
-            handle_confirmation(update, context) 
-            if "pending_command" in context.user_data
-            else handle_message(update, context)
-        )
-    ))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+
+    return application
+
+def main():
+    # Load environment variables
+    load_dotenv()
+
+    # Webhook mode: a local receiver feeding sharded worker processes
+    if os.getenv("TELEGRAM_WEBHOOK_URL"):
+        from webhook import run_webhook
+        run_webhook()
+        return
 
     # Start the bot
-    application.run_polling()
+    build_application().run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import logging
+from collections import OrderedDict, deque
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+# Deepseek doesn't publish fixed rate limits; tune these to whatever the account tolerates
+REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "5"))
+BURST = int(os.getenv("LLM_BURST", "10"))
+
+class Superseded(Exception):
+    """A queued request was dropped because a newer one from the same chat replaced it"""
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _HeldStream:
+    """Streamed response that keeps its scheduler slot until exhausted or closed"""
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self._release = release
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._release()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        finally:
+            self.release()
+
+    async def close(self):
+        try:
+            await self.stream.close()
+        finally:
+            self.release()
+
+class _Job:
+    def __init__(self, request, future, supersede):
+        self.request = request
+        self.future = future
+        self.supersede = supersede
+
+class LLMScheduler:
+    """Fair, rate-limited access to the shared AsyncOpenAI client.
+
+    Requests wait in per-chat queues that are served round-robin, so a chatty
+    chat can't starve the others. At most max_in_flight requests run at once
+    and requests start no faster than the token bucket allows. A request
+    submitted with a supersede key cancels that chat's queued request with the
+    same key (latest message wins); requests that already started are left alone.
+
+    Streamed completions hold their slot until the stream is exhausted or closed.
+    """
+
+    def __init__(self, client, max_in_flight=MAX_IN_FLIGHT, rate=REQUESTS_PER_SECOND, burst=BURST):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self._bucket = TokenBucket(rate, burst)
+        self._queues = OrderedDict()  # chat_id -> deque of jobs, in round-robin order
+        self._in_flight = 0
+        self._running = set()  # Keeps the request tasks referenced while they run
+        self._wakeup = None
+        self._dispatcher = None  # Started on the first request, once the event loop runs
+
+    def for_chat(self, chat_id, supersede=None):
+        """Client-like view whose chat.completions.create / embeddings.create go through the scheduler"""
+        def scheduled(method):
+            async def create(**kwargs):
+                return await self.submit(chat_id, lambda: method(**kwargs), supersede)
+            return SimpleNamespace(create=create)
+
+        return SimpleNamespace(
+            chat=SimpleNamespace(completions=scheduled(self.client.chat.completions.create)),
+            embeddings=scheduled(self.client.embeddings.create)
+        )
+
+    async def submit(self, chat_id, request, supersede=None):
+        """Queue request (a coroutine function) for chat_id and wait for its result"""
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        if supersede is not None:
+            self.cancel_pending(chat_id, supersede)
+
+        jobs = self._queues.setdefault(chat_id, deque())
+        job = _Job(request, asyncio.get_running_loop().create_future(), supersede)
+        jobs.append(job)
+        self._wakeup.set()
+        return await job.future
+
+    def cancel_pending(self, chat_id, supersede):
+        """Drop chat_id's queued requests with this supersede key; their callers get Superseded"""
+        for job in self._queues.get(chat_id, ()):
+            if job.supersede == supersede and not job.future.done():
+                job.future.set_exception(Superseded())
+
+    def _next_job(self):
+        """Pop the next live job, taking chats in turn"""
+        while self._queues:
+            chat_id, jobs = next(iter(self._queues.items()))
+            job = jobs.popleft()
+            if jobs:
+                self._queues.move_to_end(chat_id)
+            else:
+                del self._queues[chat_id]
+            # Superseded, or the caller stopped waiting
+            if not job.future.done():
+                return job
+        return None
+
+    def _has_work(self):
+        return any(not job.future.done() for jobs in self._queues.values() for job in jobs)
+
+    async def _dispatch(self):
+        while True:
+            if self._in_flight >= self.max_in_flight or not self._has_work():
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            await self._bucket.acquire()
+            job = self._next_job()
+            if job is None:
+                continue
+            self._in_flight += 1
+            task = asyncio.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _release_slot(self):
+        self._in_flight -= 1
+        self._wakeup.set()
+
+    async def _run(self, job):
+        held = None
+        try:
+            result = await job.request()
+            if hasattr(result, '__aiter__'):
+                # A streamed completion keeps generating after create() returns
+                result = held = _HeldStream(result, self._release_slot)
+            if not job.future.done():
+                job.future.set_result(result)
+            elif held is not None:
+                # Nobody is waiting for this stream any more
+                await held.close()
+        except Exception as e:
+            if held is not None:
+                held.release()
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            if held is None:
+                self._release_slot()
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
@@ -0,0 +1,9 @@
+import asyncio
+
+from database import NoteDatabase, check_query_plans
+
+def test_hot_queries_use_indexes(tmp_path):
+    db_name = str(tmp_path / "notes.db")
+    # Migrates the fresh database to the current schema
+    asyncio.run(NoteDatabase(db_name, readers=1).close())
+    assert check_query_plans(db_name) == {}
@@ -0,0 +1,182 @@
+# Webhook mode: python main.py with TELEGRAM_WEBHOOK_URL set
+# A local HTTP receiver accepts updates from Telegram and shards them by chat
+# id onto worker processes, each running its own Application. A chat always
+# lands on the same worker, which handles its updates one at a time, so no
+# chat's messages are reordered while different chats run in parallel. A dead
+# worker is restarted; until then its updates get a 503 so Telegram retries them.
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+import logging
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+from telegram import Bot, Update
+from database import NoteDatabase
+from main import build_application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram"
+RESTART_DELAY = 5  # Seconds between restarts of a shard's worker; until then its updates get a 503
+
+def update_chat_id(data):
+    """Chat id of a raw update without parsing it into telegram objects; 0 if it has none"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if "from" in value:
+            return value["from"]["id"]
+    return 0
+
+def run_worker(shard, shards, updates):
+    """Worker process entry point: handle the updates for one shard of chats"""
+    application = build_application(shard=(shard, shards))
+    asyncio.run(_serve(application, updates))
+
+async def _serve(application, updates):
+    await application.initialize()
+    await application.post_init(application)
+    loop = asyncio.get_running_loop()
+    chats = {}      # chat_id -> queue of updates waiting behind the one being handled
+    draining = set()  # Keeps the per-chat tasks referenced while they run
+
+    async def drain(chat_id):
+        queue = chats[chat_id]
+        while not queue.empty():
+            try:
+                await application.process_update(queue.get_nowait())
+            except Exception as e:
+                logger.error(f"Error processing update for chat {chat_id}: {e}")
+        del chats[chat_id]
+
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            update = Update.de_json(data, application.bot)
+            chat_id = update_chat_id(data)
+            if chat_id not in chats:
+                chats[chat_id] = asyncio.Queue()
+                task = asyncio.create_task(drain(chat_id))
+                draining.add(task)
+                task.add_done_callback(draining.discard)
+            chats[chat_id].put_nowait(update)
+
+        # Finish what was already received before shutting down
+        while chats:
+            await asyncio.sleep(0.1)
+    finally:
+        await application.shutdown()
+        await application.post_shutdown(application)
+
+async def _prepare_database():
+    """Migrate notes.db once, before any worker starts"""
+    db = NoteDatabase(readers=1)
+    await db.close()
+
+class WorkerPool:
+    """One worker process per shard, restarted when it dies"""
+
+    def __init__(self, context, shards):
+        self.context = context
+        self.shards = shards
+        self.queues = [None] * shards
+        self.workers = [None] * shards
+        self.started = [0.0] * shards
+        self.exited = set()  # Shards whose dead worker has been logged but not restarted yet
+
+    def start(self):
+        for shard in range(self.shards):
+            self._start_worker(shard)
+
+    def _start_worker(self, shard):
+        old = self.queues[shard]
+        # A fresh queue: a worker that died mid-get may leave the old one's lock held
+        self.queues[shard] = self.context.Queue()
+        if old is not None:
+            # Updates the dead worker never picked up
+            while True:
+                try:
+                    self.queues[shard].put(old.get_nowait())
+                except (queue.Empty, OSError, ValueError):
+                    break
+            old.close()
+        self.workers[shard] = self.context.Process(
+            target=run_worker, args=(shard, self.shards, self.queues[shard]), name=f"bot-worker-{shard}"
+        )
+        self.workers[shard].start()
+        self.started[shard] = time.monotonic()
+
+    def queue_for(self, chat_id):
+        """The queue of chat_id's shard, restarting its worker if it died; None while it can't be restarted yet"""
+        shard = chat_id % self.shards
+        worker = self.workers[shard]
+        if not worker.is_alive():
+            if shard not in self.exited:
+                self.exited.add(shard)
+                logger.error(f"{worker.name} exited with code {worker.exitcode}")
+            # Don't spin on a worker that dies right after starting
+            if time.monotonic() - self.started[shard] < RESTART_DELAY:
+                return None
+            logger.info(f"Restarting {worker.name}")
+            self.exited.discard(shard)
+            self._start_worker(shard)
+        return self.queues[shard]
+
+    def stop(self):
+        for shard_queue in self.queues:
+            shard_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+def create_receiver(pool, webhook_url, secret):
+    """ASGI app accepting Telegram webhook calls and queueing each update on its chat's shard"""
+    async def telegram(request):
+        # Telegram echoes the secret given to set_webhook in this header
+        if request.headers.get("x-telegram-bot-api-secret-token") != secret:
+            return Response(status_code=403)
+        data = await request.json()
+        shard_queue = pool.queue_for(update_chat_id(data))
+        if shard_queue is None:
+            # Telegram retries updates that don't get a 2xx
+            return Response(status_code=503)
+        shard_queue.put(data)
+        return Response()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with Bot(os.getenv("TELEGRAM_TOKEN")) as bot:
+            await bot.set_webhook(webhook_url + WEBHOOK_PATH, secret_token=secret, allowed_updates=Update.ALL_TYPES)
+        yield
+
+    return Starlette(routes=[Route(WEBHOOK_PATH, telegram, methods=["POST"])], lifespan=lifespan)
+
+def run_webhook():
+    import uvicorn
+
+    webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL").rstrip("/")
+    secret = os.getenv("TELEGRAM_WEBHOOK_SECRET") or os.urandom(16).hex()
+    shards = int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 1)))
+
+    asyncio.run(_prepare_database())
+
+    # Spawned, not forked: the parent's threads and connections shouldn't leak into workers
+    pool = WorkerPool(multiprocessing.get_context("spawn"), shards)
+    pool.start()
+
+    try:
+        uvicorn.run(
+            create_receiver(pool, webhook_url, secret),
+            host=os.getenv("WEBHOOK_HOST", "127.0.0.1"),
+            port=int(os.getenv("WEBHOOK_PORT", "8080"))
+        )
+    finally:
+        pool.stop()